@@ -0,0 +1,258 @@
+import argparse
+import datetime
+import importlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import lz_api
+
+
+# End to end benchmark: every codec over every corpus file, with warmup and
+# repetitions. Reports compression and decompression speed, ratio and peak
+# memory, and can compare against a previous JSON result to catch slowdowns.
+#
+#   python bench.py                           all levels over test_files/
+#   python bench.py -l 1,9 -o results.json    some levels, save results
+#   python bench.py -o new.json --compare old.json
+
+CORPUS_DIR = 'test_files'
+CORPUS_FILES = [
+    'la_regenta_utf16',
+    'file26.bmp',
+    'file28.bmp',
+    'aes.tar',
+    'openssl',
+    'wells_the_invisible_man',
+    'la_regenta_utf8',
+    'la_regenta_utf8_duplicado',
+    'YeMi.dna',
+    'random',
+    'repetitive',
+]
+
+# the original standalone scripts, benchmarked with their own defaults
+SCRIPT_VARIANTS = ['lz', 'lz_v2', 'lz_T', 'lz_T_v2', 'lz_T_for', 'lz_R', 'lz_R_v2', 'lz_R_dp']
+
+MB = 1024 * 1024
+DEFAULT_THRESHOLD = 0.10 # 10% slower is a regression
+
+
+def level_codec(level):
+    def compress(data):
+        return lz_api.compress(data, level=level)
+
+    def decompress(code, size):
+        return lz_api.decompress(code, size=size)
+    return compress, decompress
+
+
+def script_codec(name):
+    module = importlib.import_module(name)
+
+    def compress(data):
+        return module.LZ4().compress(data)
+
+    def decompress(code, size):
+        return module.LZ4().decompress(code)
+    return compress, decompress
+
+
+def reference_codec(mode):
+    # the lz4 package from requirements.txt, None if it is not installed
+    try:
+        import lz4.block
+    except ImportError:
+        return None
+
+    def compress(data):
+        return lz4.block.compress(data, mode=mode, store_size=False)
+
+    def decompress(code, size):
+        return lz4.block.decompress(code, uncompressed_size=size)
+    return compress, decompress
+
+
+def codecs(names):
+    # name -> (compress, decompress), unavailable codecs are skipped
+    result = {}
+    for name in names:
+        if name.lstrip('-').isdigit():
+            result['level%s' % name] = level_codec(int(name))
+        elif name in SCRIPT_VARIANTS:
+            result[name] = script_codec(name)
+        elif name in ('lz4', 'lz4hc'):
+            codec = reference_codec('high_compression' if name == 'lz4hc' else 'default')
+            if codec is None:
+                print('Skipping', name, '(lz4 package not installed)', file=sys.stderr)
+            else:
+                result[name] = codec
+        else:
+            raise ValueError('Unknown codec %r' % name)
+    return result
+
+
+def timed(function, *args, warmup=1, repetitions=3):
+    for _ in range(warmup):
+        function(*args)
+    times = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        result = function(*args)
+        times.append(time.perf_counter() - start)
+    return result, times
+
+
+def peak_memory(function, *args):
+    # traced separately, tracemalloc slows down the measured runs
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def mb_per_s(size, seconds):
+    return size / MB / seconds if seconds > 0 else float('inf')
+
+
+def bench_file(path, name, compress, decompress, warmup, repetitions, memory):
+    with open(path, 'rb') as fd:
+        data = fd.read()
+    code, compress_times = timed(compress, data, warmup=warmup, repetitions=repetitions)
+    code = bytes(code)
+    text, decompress_times = timed(decompress, code, len(data), warmup=warmup, repetitions=repetitions)
+    if bytes(text) != data:
+        raise RuntimeError('%s does not roundtrip %s' % (name, path))
+    result = {
+        'file': os.path.basename(path),
+        'codec': name,
+        'size': len(data),
+        'compressed': len(code),
+        'ratio': len(data) / len(code) if code else 0,
+        'compress_mbps': mb_per_s(len(data), min(compress_times)),
+        'compress_mbps_median': mb_per_s(len(data), statistics.median(compress_times)),
+        'decompress_mbps': mb_per_s(len(data), min(decompress_times)),
+        'decompress_mbps_median': mb_per_s(len(data), statistics.median(decompress_times)),
+    }
+    if memory:
+        result['compress_peak_memory'] = peak_memory(compress, data)
+        result['decompress_peak_memory'] = peak_memory(decompress, code, len(data))
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ''
+
+
+def print_result(result):
+    line = '%-28s %-10s ratio %6.3f  comp %9.3f MB/s  decomp %9.3f MB/s' % (
+        result['file'], result['codec'], result['ratio'],
+        result['compress_mbps'], result['decompress_mbps'])
+    if 'compress_peak_memory' in result:
+        line += '  peak %.1f/%.1f MB' % (result['compress_peak_memory'] / MB,
+                                         result['decompress_peak_memory'] / MB)
+    print(line, flush=True)
+
+
+def compare(results, baseline, threshold):
+    # prints speed and ratio changes against a previous run, returns the
+    # number of regressions
+    previous = {(r['file'], r['codec']): r for r in baseline['results']}
+    regressions = 0
+    for result in results:
+        old = previous.get((result['file'], result['codec']))
+        if old is None:
+            continue
+        for key in ('compress_mbps', 'decompress_mbps'):
+            change = result[key] / old[key] - 1 if old[key] else 0
+            flag = ''
+            if change < -threshold:
+                flag = '  REGRESSION'
+                regressions += 1
+            print('%-28s %-10s %-16s %9.3f -> %9.3f (%+.1f%%)%s' % (
+                result['file'], result['codec'], key, old[key], result[key], change * 100, flag))
+        if result['compressed'] != old['compressed']:
+            print('%-28s %-10s compressed size %d -> %d' % (
+                result['file'], result['codec'], old['compressed'], result['compressed']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the LZ4 codecs over a corpus')
+    parser.add_argument('files', nargs='*', help='files to benchmark (default: the test_files corpus)')
+    parser.add_argument('-d', '--corpus', default=CORPUS_DIR, help='corpus directory')
+    parser.add_argument('-l', '--levels', default=','.join(str(level) for level in lz_api.LEVELS),
+                        help='comma separated levels, negative ones accelerate level 1 (default: all)')
+    parser.add_argument('-s', '--scripts', default='',
+                        help='comma separated standalone scripts, "all" for every one')
+    parser.add_argument('--no-reference', action='store_true', help="don't run the lz4 package")
+    parser.add_argument('-w', '--warmup', type=int, default=1)
+    parser.add_argument('-r', '--repetitions', type=int, default=3)
+    parser.add_argument('--no-memory', action='store_true', help="don't measure peak memory")
+    parser.add_argument('-o', '--output', help='write the results as JSON')
+    parser.add_argument('--compare', help='previous JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='relative slowdown reported as a regression')
+    args = parser.parse_args()
+
+    files = args.files or [os.path.join(args.corpus, name) for name in CORPUS_FILES]
+    missing = [path for path in files if not os.path.exists(path)]
+    for path in missing:
+        print('Skipping missing file', path, file=sys.stderr)
+    if missing and not args.files:
+        print('Generate the corpus with: python corpus.py -d', args.corpus, file=sys.stderr)
+    files = [path for path in files if path not in missing]
+
+    names = [level for level in args.levels.split(',') if level]
+    if args.scripts == 'all':
+        names += SCRIPT_VARIANTS
+    else:
+        names += [name for name in args.scripts.split(',') if name]
+    if not args.no_reference:
+        names += ['lz4', 'lz4hc']
+
+    results = []
+    for path in files:
+        for name, (compress, decompress) in codecs(names).items():
+            result = bench_file(path, name, compress, decompress, args.warmup,
+                                args.repetitions, not args.no_memory)
+            print_result(result)
+            results.append(result)
+
+    report = {
+        'meta': {
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'warmup': args.warmup,
+            'repetitions': args.repetitions,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as out:
+            json.dump(report, out, indent=2)
+    if args.compare:
+        with open(args.compare) as fd:
+            regressions = compare(results, json.load(fd), args.threshold)
+        if regressions:
+            print(regressions, 'regression(s) over', '%d%%' % (args.threshold * 100))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+import argparse
+import os
+import random
+import struct
+import sys
+
+
+# Deterministic synthetic stand-ins for the test_files corpus used by bench.py.
+# Every file is generated from a seeded random.Random and streamed to disk in
+# chunks, so the same seed gives the same bytes on any machine and sizes of
+# several GB don't need the data in memory. Sizes are exact, a text file may
+# end in the middle of a character.
+#
+#   python corpus.py                        every file, 1MB each, seed 0
+#   python corpus.py -s 2G YeMi.dna openssl
+#   python corpus.py -d /tmp/corpus --seed 7
+
+CORPUS_DIR = 'test_files'
+DEFAULT_SIZE = 1024 * 1024
+DEFAULT_SEED = 0
+CHUNK_SIZE = 1024 * 1024
+
+SIZE_SUFFIXES = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_size(text):
+    text = text.strip().upper().rstrip('B')
+    if text and text[-1] in SIZE_SUFFIXES:
+        return int(float(text[:-1]) * SIZE_SUFFIXES[text[-1]])
+    return int(text)
+
+
+# TEXT
+
+SPANISH_SYLLABLES = ['la', 'de', 'que', 'el', 'en', 'con', 'por', 'se', 'lo', 'su', 'ra', 'ta',
+                     'ma', 'na', 'do', 'da', 'ci', 'ón', 'ía', 'ba', 'mo', 'to', 're', 'ca',
+                     'tra', 'pre', 'es', 'ar', 'ña', 'qué', 'ás', 'é', 'gu', 'ri', 'men', 'te']
+ENGLISH_SYLLABLES = ['the', 'and', 'in', 'ing', 'er', 'on', 'an', 'ed', 'to', 'it', 'is', 'at',
+                     'he', 'ha', 'en', 'ou', 'es', 'st', 'th', 'or', 'ly', 'ble', 'man', 'vis']
+VOCABULARY_SIZE = 5000
+
+
+def vocabulary(rng, syllables):
+    # pseudo words built from syllables, weighted by Zipf's law like real text
+    words = []
+    for _ in range(VOCABULARY_SIZE):
+        count = min(1 + int(rng.expovariate(0.7)), 5)
+        words.append(''.join(rng.choice(syllables) for _ in range(count)))
+    weights = [1 / rank for rank in range(1, VOCABULARY_SIZE + 1)]
+    return words, weights
+
+
+def text_chunks(rng, syllables):
+    # yields str chunks of sentences and paragraphs
+    words, weights = vocabulary(rng, syllables)
+    while True:
+        chosen = rng.choices(words, weights, k=16384)
+        position = 0
+        parts = []
+        while position < len(chosen):
+            length = rng.randint(4, 30)
+            sentence = ' '.join(chosen[position:position + length])
+            position += length
+            parts.append(sentence[:1].upper() + sentence[1:])
+            parts.append(rng.choice(('. ', '. ', '. ', ', ', '; ', '? ', '! ', '.\n\n')))
+        yield ''.join(parts)
+
+
+def spanish_text(rng, encoding='utf-8'):
+    if encoding == 'utf-16':
+        yield b'\xff\xfe'
+        encoding = 'utf-16-le'
+    for chunk in text_chunks(rng, SPANISH_SYLLABLES):
+        yield chunk.encode(encoding)
+
+
+def english_text(rng):
+    for chunk in text_chunks(rng, ENGLISH_SYLLABLES):
+        yield chunk.encode('ascii')
+
+
+# DNA
+
+def dna(rng):
+    # 4 symbol sequence in 70 column lines, with repeated motifs and tandem
+    # repeats like real genomes
+    motifs = [''.join(rng.choices('ACGT', k=rng.randint(6, 300))) for _ in range(200)]
+    line = 70
+    pending = ''
+    yield b'>chrI synthetic\n'
+    while True:
+        parts = []
+        for _ in range(256):
+            kind = rng.random()
+            if kind < 0.80:
+                parts.append(''.join(rng.choices('ACGT', (30, 20, 20, 30), k=rng.randint(50, 500))))
+            elif kind < 0.95:
+                parts.append(rng.choice(motifs))
+            else:
+                parts.append(rng.choice(('A', 'T', 'CA', 'TA', 'GAA')) * rng.randint(5, 60))
+        sequence = pending + ''.join(parts)
+        full = len(sequence) // line * line
+        pending = sequence[full:]
+        yield '\n'.join(sequence[i:i + line] for i in range(0, full, line)).encode('ascii') + b'\n'
+
+
+# BITMAP
+
+BMP_WIDTH = 1024
+
+
+def bitmap(rng, size, flat=0.8):
+    # 24 bit BMP of flat shapes over gradients with some noise. Rows change
+    # little from one to the next, flat is the share of flat colored runs
+    row_bytes = (BMP_WIDTH * 3 + 3) & ~3
+    height = max(1, (size - 54) // row_bytes)
+    yield b'BM' + struct.pack('<IHHI', size, 0, 0, 54)
+    yield struct.pack('<IiiHHIIiiII', 40, BMP_WIDTH, height, 1, 24, 0, row_bytes * height,
+                      2835, 2835, 0, 0)
+    padding = bytes(row_bytes - BMP_WIDTH * 3)
+    # noisy gradients are cut from a pool, generating them per pixel is slow
+    gradients = [bytes(((base + i // 3 + rng.randrange(4)) & 0xFF) for i in range(BMP_WIDTH * 6))
+                 for base in range(0, 256, 8)]
+    row = None
+    for y in range(height):
+        if row is None or rng.random() < 0.02:
+            runs = []
+            x = 0
+            while x < BMP_WIDTH:
+                length = min(rng.randint(8, 256), BMP_WIDTH - x)
+                color = bytes(rng.randrange(256) for _ in range(3))
+                runs.append((color, length, rng.random() < flat))
+                x += length
+        parts = []
+        for color, length, is_flat in runs:
+            if is_flat:
+                parts.append(color * length)
+            else:
+                start = rng.randrange(BMP_WIDTH * 3) // 3 * 3
+                parts.append(rng.choice(gradients)[start:start + length * 3])
+        row = b''.join(parts)
+        yield row + padding
+    # whatever doesn't fill a row is left as trailing zeros
+    yield bytes(max(0, size - 54 - row_bytes * height))
+
+
+# EXECUTABLE
+
+OPCODES = bytes([0x48, 0x89, 0x8B, 0xE8, 0xC3, 0x83, 0x0F, 0x85, 0x84, 0x74, 0x75, 0xFF,
+                 0x31, 0xC0, 0x5D, 0x55, 0x41, 0x4C, 0x8D, 0x45, 0x24, 0x08, 0x10, 0x00])
+IDENTIFIER_PARTS = ['SSL', 'CTX', 'EVP', 'BIO', 'X509', 'new', 'free', 'get', 'set', 'cipher',
+                    'digest', 'init', 'update', 'final', 'ctrl', 'read', 'write', 'key', 'RSA']
+
+
+def executable(rng):
+    # ELF like mix of machine code, string tables, relocation tables and zero
+    # padding
+    yield b'\x7fELF\x02\x01\x01' + bytes(9) + struct.pack('<HHI', 3, 62, 1)
+    snippets = [bytes(rng.choices(OPCODES, k=rng.randint(3, 15))) for _ in range(2000)]
+    address = 0x400000
+    while True:
+        kind = rng.random()
+        if kind < 0.6:
+            # code: frequent instruction sequences with random immediates
+            parts = []
+            for _ in range(rng.randint(200, 2000)):
+                parts.append(rng.choice(snippets))
+                if rng.random() < 0.3:
+                    parts.append(struct.pack('<I', rng.randrange(1 << 20)))
+            yield b''.join(parts)
+        elif kind < 0.8:
+            # string table
+            names = ['_'.join(rng.choices(IDENTIFIER_PARTS, k=rng.randint(2, 4)))
+                     for _ in range(rng.randint(50, 500))]
+            yield '\0'.join(names).encode('ascii') + b'\0'
+        elif kind < 0.9:
+            # relocations: increasing addresses
+            count = rng.randint(50, 500)
+            entries = []
+            for _ in range(count):
+                address += rng.randint(1, 64) * 8
+                entries.append(struct.pack('<QQ', address, rng.randrange(8)))
+            yield b''.join(entries)
+        else:
+            yield bytes(rng.randint(16, 4096))
+
+
+# RANDOM AND REPETITIVE
+
+def random_data(rng):
+    while True:
+        yield rng.randbytes(CHUNK_SIZE)
+
+
+def repetitive(rng):
+    pattern = b'All work and no play makes Jack a dull boy. '
+    while True:
+        yield pattern * (CHUNK_SIZE // len(pattern))
+
+
+# TAR
+
+def tar_header(name, size, mtime):
+    header = bytearray(512)
+    header[0:len(name)] = name.encode('ascii')
+    header[100:108] = b'0000644\0'
+    header[108:116] = b'0001750\0'
+    header[116:124] = b'0001750\0'
+    header[124:136] = b'%011o\0' % size
+    header[136:148] = b'%011o\0' % mtime
+    header[148:156] = b' ' * 8
+    header[156:157] = b'0'
+    header[257:265] = b'ustar  \0'
+    checksum = sum(header)
+    header[148:156] = b'%06o\0 ' % checksum
+    return bytes(header)
+
+
+def tar(rng):
+    # ustar archive mixing text, code, images and encrypted (random) members
+    members = [('txt', lambda r: spanish_text(r)), ('c', lambda r: english_text(r)),
+               ('o', executable), ('bmp', lambda r: bitmap(r, 1 << 30)), ('aes', random_data)]
+    index = 0
+    while True:
+        extension, generator = rng.choice(members)
+        size = int(rng.expovariate(1 / 65536)) + 1
+        yield tar_header('data/file%05d.%s' % (index, extension), size, 1600000000 + index)
+        yield from take(generator(random.Random(rng.random())), size)
+        yield bytes(-size % 512)
+        index += 1
+
+
+def take(chunks, size):
+    # yields the first size bytes of a chunk stream
+    for chunk in chunks:
+        if len(chunk) >= size:
+            yield chunk[:size]
+            return
+        yield chunk
+        size -= len(chunk)
+
+
+def duplicated(rng, size):
+    # the same text twice, like la_regenta_utf8_duplicado
+    state = rng.getstate()
+    yield from take(spanish_text(rng), size // 2)
+    rng.setstate(state)
+    yield from take(spanish_text(rng), size - size // 2)
+
+
+# name -> generator(rng, size)
+GENERATORS = {
+    'la_regenta_utf16': lambda rng, size: spanish_text(rng, 'utf-16'),
+    'file26.bmp': lambda rng, size: bitmap(rng, size, flat=0.95),
+    'file28.bmp': lambda rng, size: bitmap(rng, size, flat=0.6),
+    'aes.tar': lambda rng, size: tar(rng),
+    'openssl': lambda rng, size: executable(rng),
+    'wells_the_invisible_man': lambda rng, size: english_text(rng),
+    'la_regenta_utf8': lambda rng, size: spanish_text(rng),
+    'la_regenta_utf8_duplicado': duplicated,
+    'YeMi.dna': lambda rng, size: dna(rng),
+    'random': lambda rng, size: random_data(rng),
+    'repetitive': lambda rng, size: repetitive(rng),
+}
+# the utf8, utf16 and duplicated versions hold the same text
+SEED_NAMES = {'la_regenta_utf16': 'la_regenta_utf8', 'la_regenta_utf8_duplicado': 'la_regenta_utf8'}
+
+
+def generate(name, path, size=DEFAULT_SIZE, seed=DEFAULT_SEED):
+    # every file gets its own stream, derived from the seed and its name
+    rng = random.Random('%s:%s' % (seed, SEED_NAMES.get(name, name)))
+    with open(path, 'wb') as out:
+        buffer = bytearray()
+        for chunk in take(GENERATORS[name](rng, size), size):
+            buffer += chunk
+            if len(buffer) >= CHUNK_SIZE:
+                out.write(buffer)
+                buffer = bytearray()
+        out.write(buffer)
+
+
+def generate_corpus(directory=CORPUS_DIR, size=DEFAULT_SIZE, seed=DEFAULT_SEED, names=None):
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for name in names or GENERATORS:
+        if name not in GENERATORS:
+            raise ValueError('Unknown corpus file %r, expected one of %s' % (name, sorted(GENERATORS)))
+        path = os.path.join(directory, name)
+        generate(name, path, size, seed)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate the synthetic benchmark corpus')
+    parser.add_argument('names', nargs='*', help='files to generate (default: all of %s)' %
+                        ', '.join(GENERATORS))
+    parser.add_argument('-d', '--directory', default=CORPUS_DIR)
+    parser.add_argument('-s', '--size', type=parse_size, default=DEFAULT_SIZE,
+                        help='size of every file, K/M/G suffixes allowed')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    args = parser.parse_args()
+    try:
+        for path in generate_corpus(args.directory, args.size, args.seed, args.names):
+            print('Generated', path, os.path.getsize(path), 'bytes')
+    except ValueError as error:
+        print(error)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,7 @@
 import sys
+from lz_common import (HASH_LOG, KEY_READERS, as_buffer, hash_params, hash_table, map_file, match_length,
+                       with_dictionary)
+import lz_decoder
 
 class LZ4:
 
@@ -9,57 +12,105 @@ class LZ4:
     MINIMUM_LENGTH = 4
     GOOD_ENOUGH_SIZE = 64
     MAX_OFFSET = 65535 # 2 BYTES = 65535
+    LAST_LITERALS = 5 # last 5 bytes of a block are always literals
+    MFLIMIT = 12 # last match must start at least 12 bytes before the end
+    KEY_LENGTH = 8 # bytes hashed per position (4 or 8), also the minimum match
+    ACCELERATION = 1 # higher values skip faster over data that doesn't match
+    SKIP_TRIGGER = 6 # the step grows by one every 2 ** SKIP_TRIGGER misses
 
     LENGTH = 0
 
-    def __init__(self):
+    def __init__(self, key_length=KEY_LENGTH, hash_log=HASH_LOG, acceleration=ACCELERATION):
+        if key_length not in KEY_READERS:
+            raise ValueError('Invalid key length %r, expected one of %s' % (key_length, sorted(KEY_READERS)))
+        if acceleration < 1:
+            raise ValueError('Invalid acceleration %r, expected 1 or more' % acceleration)
         self.literalLength = 0
         self.matchLength = 0
         self.offset = 0
         self.it = 0
-        self.table = {}
-
-
-    def compress(self, text):
+        self.key_length = key_length
+        self.hash_log = hash_log
+        self.acceleration = acceleration
+        self.table = None
+        self.indexed = 0 # end of the previous text's indexed positions
+        self.dictionary = b''
+        self.dictionary_table = None
+
+    def load_dictionary(self, dictionary):
+        # indexes the dictionary once, compress() then starts every call from
+        # a copy of its table as if the text followed the dictionary
+        self.dictionary, start = with_dictionary(dictionary, b'')
+        self.dictionary_table = self.index(self.dictionary, start)
+
+    def index(self, text, start, table=None, first=0):
+        # table with the positions before start indexed, from first on if the
+        # table already has the ones before
+        key_length = self.key_length
+        read_key = KEY_READERS[key_length]
+        prime, mask, shift = hash_params(key_length, self.hash_log)
+        if table is None:
+            # position of the last key seen for every hash, fixed size
+            table = hash_table(self.hash_log, len(text))
+        for index in range(max(0, first, start - LZ4.MAX_OFFSET), min(start, len(text) - key_length + 1)):
+            table[((read_key(text, index)[0] * prime) & mask) >> shift] = index
+        return table
+
+    def compress(self, text, start=0, resume=False):
+        # bytes before start are history, they are only indexed. Without
+        # history the loaded dictionary (if any) is the history. With resume
+        # text goes on from the previous call's, whose table is kept
+        if resume and self.table is not None:
+            table = self.index(text, start, self.table, self.indexed)
+        elif self.dictionary and not start:
+            text, start = with_dictionary(self.dictionary, text)
+            # only keys running past the dictionary are left to index
+            table = self.index(text, start, self.dictionary_table[:], start - self.key_length + 1)
+        else:
+            table = None
+        text, view = as_buffer(text, in_place=True)
         text_length = len(text)
-        iterator = 0
+        key_length = self.key_length
+        read_key = KEY_READERS[key_length]
+        prime, mask, shift = hash_params(key_length, self.hash_log)
+        if table is None:
+            table = self.index(text, start)
+        self.table = table
+        iterator = start
         blocks = bytearray()
-        last_match = 0
-        table = {}
-
-        while iterator < text_length:
-            # get next literal
-            literal_end = iterator + 8
-            literal = text[iterator:literal_end]
-            # if literal in table
-            if literal in table:
-                # get match
-                match_start = table[literal]
-                # calculate the offset
-                offset = iterator - match_start
-                # continue if offset is within range
-                if offset <= 65535:
-                    match_index = match_start + 8
-                    # get longest match length
-                    while literal_end < text_length and text[match_index] == text[literal_end]:
-                        match_index += 1
-                        literal_end += 1
-
-                    length = match_index - match_start
-                    LZ4.createBlock(blocks, text[last_match:iterator], iterator - last_match, length, offset)
-                    iterator += length
-                    last_match = iterator
-                # skip match
-                else:
-                    table[literal] = iterator
-                    iterator += 1
-            # skip match
+        last_match = start
+        match_limit = text_length - LZ4.LAST_LITERALS
+        match_end = min(text_length - LZ4.MFLIMIT, match_limit - key_length + 1)
+        max_offset = LZ4.MAX_OFFSET
+        # like the reference LZ4, every miss adds one to search_count and the
+        # step is search_count >> SKIP_TRIGGER, a match resets it
+        skip_trigger = LZ4.SKIP_TRIGGER
+        first_search = self.acceleration << skip_trigger
+        search_count = first_search
+
+        while iterator < match_end:
+            # get next key and its candidate
+            key = read_key(text, iterator)[0]
+            h = ((key * prime) & mask) >> shift
+            match_start = table[h]
+            table[h] = iterator
+            offset = iterator - match_start
+            # the candidate may be a collision, compare the keys
+            if 0 < offset <= max_offset and read_key(text, match_start)[0] == key:
+                # get longest match length
+                length = key_length + match_length(text, match_start + key_length,
+                                                   iterator + key_length, match_limit)
+                LZ4.createBlock(blocks, view[last_match:iterator], iterator - last_match, length, offset)
+                iterator += length
+                last_match = iterator
+                search_count = first_search
+            # skip match, faster the longer it has been since the last one
             else:
-                table[literal] = iterator
-                iterator += 1
-
+                iterator += search_count >> skip_trigger
+                search_count += 1
 
-        LZ4.createBlock(blocks, text[last_match:iterator], iterator - last_match, 0, 0, last_block=True)
+        self.indexed = min(iterator, text_length - key_length + 1)
+        LZ4.createBlock(blocks, view[last_match:], text_length - last_match, 0, 0, last_block=True)
         return blocks
 
     @staticmethod
@@ -102,65 +153,9 @@ class LZ4:
 
     # DECOMPRESSION
 
-    @staticmethod
-    def readVariableLength(iterator, code):
-        length = 15
-        s = 255
-        while s == 255:
-            s = code[iterator]
-            iterator += 1
-            length += s
-
-        return length, iterator
-
-
-
-    def decompress(self, code):
-        iterator = 0
-        out = bytearray()
-        LZ4.LENGTH = len(code)
-        while iterator != LZ4.LENGTH:
-            # first read token
-            token = code[iterator]
-            # increment iterator
-            iterator += 1
-            # read literal length
-            length = token >> 4
-            # read literals
-            if length == 15:
-                length, iterator = LZ4.readVariableLength(iterator, code)
-            out += code[iterator:iterator + length]
-            iterator += length
-            # after literal always check if we are in the last block
-
-            if iterator == LZ4.LENGTH:
-                break
-            # read offset
-            offset = code[iterator] + (code[iterator + 1] << 8)
-            iterator += 2
-            # read match length
-            length = token & 0x0F
-            # read matches
-            if length == 15:
-                length, iterator = LZ4.readVariableLength(iterator, code)
-            # always add 4 to length (MINMATCH)
-            length += 4
-            # read match
-            initialLength = len(out)
-            # begin representes where the match starts
-            pos = initialLength - offset
-            # match distance is the distance of begin to the end of text
-            distance = initialLength - pos
-            # preacollate
-            out +=  b"0" * length
-            if distance < length:
-                for i in range(length):
-                    out[initialLength + i] = out[pos + i]
-            else:
-                out[initialLength:] = out[pos:pos + length]
-
-
-        return out
+    def decompress(self, code, prefix=b''):
+        # prefix is the already decoded history that matches may refer to
+        return lz_decoder.decompress(code, prefix=prefix)
 
 
 
@@ -179,7 +174,7 @@ def main():
         fd = open(file, 'rb')
         print('Compressing file', file)
         # read file and encode
-        text = fd.read()
+        text = map_file(fd)
         code = encoder.compress(text)
         print('Ratio:', len(text) / len(code))
         # create new file
@@ -191,7 +186,7 @@ def main():
         file = sys.argv[2]
         fd = open(file, 'rb')
         print('Decompressing file', file)
-        text = encoder.decompress(fd.read())
+        text = encoder.decompress(map_file(fd))
         # create new file
         with open(".".join(file.split('.')[:-1]), 'wb') as out:
             out.write(text)
@@ -1,28 +1,11 @@
-import collections
 import sys
 import cProfile
+from lz_common import (BINARY_TREE, HASH_CHAIN, HASH_LOG, KEY_READERS, BinaryTreeTable,
+                       HashChainTable, WORD_SIZE, as_buffer, map_file, match_length, read_word,
+                       with_dictionary)
+import lz_decoder
 
-
-class LinkedHashTable:
-
-    MAX_TABLE_SIZE = 8000000
-    QUEUE_SIZE = 5000
-
-    def __init__(self):
-        self.table = {}
-
-    def find(self, literal):
-        if literal in self.table:
-            return self.table[literal]
-        return None
-
-    def add(self, literal, index):
-        if literal in self.table:
-            # important, it is faster to append left, this way we don't have to
-            # iterate matche in reverse order. It has a O(1) time complexity
-            self.table[literal].appendleft(index)
-        else:
-            self.table[literal] = collections.deque([index], maxlen=20000)
+read_key = KEY_READERS[4]
 
 
 class LZ4:
@@ -34,90 +17,154 @@ class LZ4:
     MINIMUM_LENGTH = 4
     GOOD_ENOUGH_SIZE = 1024
     MAX_OFFSET = 65535 # 2 BYTES = 65535
-
-    def __init__(self):
+    LAST_LITERALS = 5 # last 5 bytes of a block are always literals
+    MFLIMIT = 12 # last match must start at least 12 bytes before the end
+    LOOKAHEAD = 5 # positions tried after a match looking for a longer one
+    CHAIN_DEPTH = 20000 # candidates tried per position
+    MATCH_FINDERS = (HASH_CHAIN, BINARY_TREE)
+
+    def __init__(self, chain_depth=CHAIN_DEPTH, lookahead=LOOKAHEAD,
+                 good_enough_size=GOOD_ENOUGH_SIZE, hash_log=HASH_LOG, match_finder=HASH_CHAIN):
+        if match_finder not in LZ4.MATCH_FINDERS:
+            raise ValueError('Invalid match finder %r, expected one of %s' % (match_finder, LZ4.MATCH_FINDERS))
         self.literalLength = 0
         self.matchLength = 0
         self.offset = 0
         self.it = 0
-        self.table = LinkedHashTable()
-
-
-    def find_best(self, text, literal, pos):
-        match_indices = self.table.find(literal)
+        self.chain_depth = chain_depth
+        self.lookahead = lookahead
+        self.good_enough_size = good_enough_size
+        self.hash_log = hash_log
+        self.match_finder = match_finder
+        self.table = None
+        self.indexed = 0 # positions of the previous text before it are in table
+        self.dictionary = b''
+        self.dictionary_table = None
+
+    def load_dictionary(self, dictionary):
+        # indexes the dictionary once, compress() then starts every call from
+        # a copy of its table as if the text followed the dictionary
+        self.dictionary, start = with_dictionary(dictionary, b'')
+        self.dictionary_table = self.index(self.dictionary, start, len(self.dictionary))
+
+    def index(self, text, start, limit, table=None, first=0):
+        # match table with the positions before start indexed, from first on
+        # if table already has the ones before
+        first = max(0, first, start - LZ4.MAX_OFFSET)
+        if table is None and self.match_finder == BINARY_TREE:
+            # the tree inserts positions as they are searched
+            table = BinaryTreeTable(text, limit, self.chain_depth, self.good_enough_size, first, self.hash_log)
+        elif table is None:
+            table = HashChainTable(len(text), self.hash_log)
+        elif self.match_finder == BINARY_TREE:
+            # the tree reads its keys from the text, which has grown
+            table.text = text
+            table.limit = limit
+            table.next = max(table.next, first)
+        for index in range(first, min(start, len(text) - 3)):
+            table.add(read_key(text, index)[0], index)
+        return table
+
+
+    def find_best(self, text, key, pos, limit):
+        # limit: matches end before it
+        if self.match_finder == BINARY_TREE:
+            matches = self.table.find(pos)
+            if not matches:
+                return False, 3, -1
+            length, offset = matches[-1]
+            return True, length, offset
+        # walks the hash chain newest first, chains mix keys with the same
+        # hash so every candidate's key is compared before extending it
+        prev = self.table.prev
+        index = self.table.head[self.table.hash(key)]
         best_match_length = 3
         best_offset = -1
         match_found = False
-        if match_indices is not None:
-            for index in match_indices:
-                match_length, offset = LZ4.iterate(text, index, pos, best_match_length)
-                if offset == match_length == 0:
-                    break
-                if match_length > best_match_length:
+        depth = self.chain_depth
+        # the key and the 4 bytes after it, candidates are compared with it
+        # word by word inline, most matches end within it
+        word = read_word(text, pos)[0]
+        while depth and 0 < pos - index <= LZ4.MAX_OFFSET:
+            depth -= 1
+            # cheap test first, a worse candidate can't extend past the best length
+            if text[index + best_match_length] == text[pos + best_match_length]:
+                difference = read_word(text, index)[0] ^ word
+                if difference & 0xFFFFFFFF:
+                    # another key with the same hash
+                    index = prev[index & HashChainTable.WINDOW_MASK]
+                    continue
+                if difference:
+                    length = ((difference & -difference).bit_length() - 1) >> 3
+                else:
+                    length = WORD_SIZE + match_length(text, index + WORD_SIZE, pos + WORD_SIZE, limit)
+                if length > best_match_length:
                     match_found = True
-                    best_match_length = match_length
-                    best_offset = offset
-                    if best_match_length >= 65535:
+                    best_match_length = length
+                    best_offset = pos - index
+                    if best_match_length >= self.good_enough_size:
                         break
+            index = prev[index & HashChainTable.WINDOW_MASK]
 
         return match_found, best_match_length, best_offset
 
-    @staticmethod
-    def iterate(text, match_index, literal_index, best_length):
-        match_length = 4
-        offset = literal_index - match_index
-        if offset > 65535 :
-            return 0, 0
-        left_index = match_index + best_length
-        right_index = literal_index + best_length
-        if right_index < LZ4.LENGTH and text[left_index]  != text[right_index]:# this is a worse candidate
-            return -1, -1
-        k = match_index + 4
-        j = literal_index + 4
-        # search buffer
-
-        while j < LZ4.LENGTH and text[j] == text[k]:
-            j += 1
-            k += 1
-        # adding k - match_length instead of match_length += 1 improves
-        # speed by a little
-        return k - match_index, offset
-
-
-    def compress(self, text):
-        iterator = 0
+    def compress(self, text, start=0, resume=False):
+        # bytes before start are history (e.g. the previous block of a linked
+        # frame), they are only indexed so that matches can point into them.
+        # Without history the loaded dictionary (if any) is the history. With
+        # resume text goes on from the previous call's, whose table is kept
+        table = None
+        first = 0
+        if resume and self.table is not None:
+            table = self.table
+            first = self.indexed
+        elif self.dictionary and not start:
+            text, start = with_dictionary(self.dictionary, text)
+            table = self.dictionary_table.copy()
+            first = start - 3
+        text, view = as_buffer(text, in_place=True)
+        iterator = start
         blocks = bytearray()
-        last_match = 0
-        LZ4.LENGTH = len(text)
-        while iterator < LZ4.LENGTH:
-            literal = text[iterator:iterator + 4]
-            match_found, match_length, offset = self.find_best(text, literal, iterator)
+        last_match = start
+        # per call values stay in locals, encoders of other threads share
+        # the class
+        length = len(text)
+        match_limit = length - LZ4.LAST_LITERALS
+        match_end = length - LZ4.MFLIMIT
+        self.table = self.index(text, start, match_limit, table, first)
+        while iterator < match_end:
+            key = read_key(text, iterator)[0]
+            match_found, match_length, offset = self.find_best(text, key, iterator, match_limit)
             if match_found: # match found
-                for k in range(5):
-                    literal_next = text[iterator+1:iterator+ 5]
-                    match_found, match_length_next, offset_next = self.find_best(text, literal_next, iterator + 1)
+                for k in range(self.lookahead):
+                    if iterator + 1 >= match_end:
+                        break
+                    key_next = read_key(text, iterator + 1)[0]
+                    match_found, match_length_next, offset_next = self.find_best(text, key_next, iterator + 1, match_limit)
                     # if match at next position is better take it instead of this
                     if match_length_next > match_length:
-                        self.table.add(literal, iterator)
+                        self.table.add(key, iterator)
                         iterator += 1
                         match_length = match_length_next
                         offset = offset_next
-                        literal = literal_next
+                        key = key_next
                     else:
                         break
                 # print('Match found with length', match_length, 'and offset', offset)
-                LZ4.createBlock(blocks, text[last_match:iterator], iterator - last_match, match_length, offset)
-                self.table.add(literal, iterator) # remove line to increase speed
+                LZ4.createBlock(blocks, view[last_match:iterator], iterator - last_match, match_length, offset)
+                self.table.add(key, iterator) # remove line to increase speed
                 # remove for increased speed, but less compression
-                for blockByte in range(iterator, match_length + iterator, 1):
-                    self.table.add(text[blockByte:blockByte + 4], blockByte)
+                for blockByte in range(iterator + 1, match_length + iterator, 1):
+                    self.table.add(read_key(text, blockByte)[0], blockByte)
                 iterator += match_length
                 last_match = iterator
             else:
-                self.table.add(literal, iterator)
+                self.table.add(key, iterator)
                 iterator += 1
 
-        LZ4.createBlock(blocks, text[last_match:iterator], iterator - last_match, 0, 0, last_block=True)
+        # every position before the last one reached has been added
+        self.indexed = min(iterator, length - 3)
+        LZ4.createBlock(blocks, view[last_match:], length - last_match, 0, 0, last_block=True)
         return blocks
 
     @staticmethod
@@ -160,65 +207,9 @@ class LZ4:
 
     # DECOMPRESSION
 
-    @staticmethod
-    def readVariableLength(iterator, code):
-        length = 15
-        s = 255
-        while s == 255:
-            s = code[iterator]
-            iterator += 1
-            length += s
-
-        return length, iterator
-
-
-
-    def decompress(self, code):
-        iterator = 0
-        out = bytearray()
-        LZ4.LENGTH = len(code)
-        while iterator != LZ4.LENGTH:
-            # first read token
-            token = code[iterator]
-            # increment iterator
-            iterator += 1
-            # read literal length
-            length = token >> 4
-            # read literals
-            if length == 15:
-                length, iterator = LZ4.readVariableLength(iterator, code)
-            out += code[iterator:iterator + length]
-            iterator += length
-            # after literal always check if we are in the last block
-
-            if iterator == LZ4.LENGTH:
-                break
-            # read offset
-            offset = code[iterator] + (code[iterator + 1] << 8)
-            iterator += 2
-            # read match length
-            length = token & 0x0F
-            # read matches
-            if length == 15:
-                length, iterator = LZ4.readVariableLength(iterator, code)
-            # always add 4 to length (MINMATCH)
-            length += 4
-            # read match
-            initialLength = len(out)
-            # begin representes where the match starts
-            pos = initialLength - offset
-            # match distance is the distance of begin to the end of text
-            distance = initialLength - pos
-            # preacollate
-            out +=  b"0" * length
-            if distance < length:
-                for i in range(length):
-                    out[initialLength + i] = out[pos + i]
-            else:
-                out[initialLength:] = out[pos:pos + length]
-
-
-        return out
+    def decompress(self, code, prefix=b''):
+        # prefix is the already decoded history that matches may refer to
+        return lz_decoder.decompress(code, prefix=prefix)
 
 
 
@@ -237,7 +228,7 @@ def main():
         fd = open(file, 'rb')
         print('Compressing file', file)
         # read file and encode
-        text = fd.read()
+        text = map_file(fd)
         code = encoder.compress(text)
         print('Ratio:', len(text) / len(code))
         # create new file
@@ -249,7 +240,7 @@ def main():
         file = sys.argv[2]
         fd = open(file, 'rb')
         print('Decompressing file', file)
-        text = encoder.decompress(fd.read())
+        text = encoder.decompress(map_file(fd))
         # create new file
         with open(".".join(file.split('.')[:-1]), 'wb') as out:
             out.write(text)
@@ -1,31 +1,18 @@
-from tqdm import tqdm
-import collections
 import sys
+from array import array
+from lz_common import (BINARY_TREE, HASH_CHAIN, HASH_LOG, KEY_READERS, SUFFIX_ARRAY, BinaryTreeTable,
+                       HashChainTable, WORD_SIZE, as_buffer, map_file, match_length, read_word,
+                       with_dictionary)
+import lz_decoder
+import lz_suffix
+from lz_progress import NO_PROGRESS, TqdmProgress
 
+read_key = KEY_READERS[4]
 
+# parsers: how the matches found are chosen
+BACKWARD = 'backward' # one pass from the end over the longest matches, estimated costs
+SHORTEST_PATH = 'path' # exact costs of every match length, shortest path from the start
 
-class LinkedHashTable:
-
-    MAX_TABLE_SIZE = 8000000
-
-    def __init__(self):
-        self.table = {}
-
-    def find(self, literal):
-        if literal in self.table:
-            value = self.table[literal]
-            return value
-        else:
-            return None
-
-
-    def add(self, literal, index):
-        if literal in self.table:
-            self.table[literal].append(index)
-        else:
-            self.table[literal] = collections.deque([index], maxlen=500)
-        if len(self.table) > LinkedHashTable.MAX_TABLE_SIZE:
-            print("full") 
 
 
 class LZ4:
@@ -42,86 +29,243 @@ class LZ4:
     MAX_LENGTH_CODE = 255 
     LITERAL_COST = 1 # 1 byte 
     END_LITERALS = 5 # 4 last literals don't have match 
+    MFLIMIT = 12 # last match must start at least 12 bytes before the end
+    CHAIN_DEPTH = 500 # candidates tried per position
+    WINDOW_SIZE = 1 << 18 # positions parsed at a time
+    WINDOW_OVERLAP = 1 << 12 # positions parsed past the window, then again with the next
    
-    def __init__(self):
+    MATCH_FINDERS = (HASH_CHAIN, SUFFIX_ARRAY, BINARY_TREE)
+    PARSERS = (BACKWARD, SHORTEST_PATH)
+
+    def __init__(self, chain_depth=CHAIN_DEPTH, good_enough_size=GOOD_ENOUGH_SIZE, hash_log=HASH_LOG,
+                 match_finder=HASH_CHAIN, parser=SHORTEST_PATH, window_size=WINDOW_SIZE,
+                 window_overlap=WINDOW_OVERLAP, progress=None):
+        if match_finder not in LZ4.MATCH_FINDERS:
+            raise ValueError('Invalid match finder %r, expected one of %s' % (match_finder, LZ4.MATCH_FINDERS))
+        if parser not in LZ4.PARSERS:
+            raise ValueError('Invalid parser %r, expected one of %s' % (parser, LZ4.PARSERS))
         self.literalLength = 0
         self.matchLength = 0
         self.offset = 0
         self.it = 0
-        self.table = LinkedHashTable()
-    def find_best(self, text, literal):
-        match_indices = self.table.find(literal)
+        self.chain_depth = chain_depth
+        self.good_enough_size = good_enough_size
+        self.hash_log = hash_log
+        self.match_finder = match_finder
+        # the finder of the current call. The suffix array sorts the history
+        # with every block, with history (a dictionary, the text before start
+        # or the previous call's) the binary tree is used instead, it indexes
+        # the history once
+        self.finder = match_finder
+        self.parser = parser
+        self.window_size = window_size
+        self.window_overlap = window_overlap
+        # told about every window compressed (lz_progress.py)
+        self.progress = progress if progress is not None else NO_PROGRESS
+        self.table = None
+        self.indexed = 0 # positions of the previous text before it are in table
+        self.dictionary = b''
+        self.dictionary_table = None
+
+    def load_dictionary(self, dictionary):
+        # indexes the dictionary once, compress() then starts every call from
+        # a copy of its table as if the text followed the dictionary
+        self.dictionary, start = with_dictionary(dictionary, b'')
+        self.finder = self.history_finder()
+        self.dictionary_table = self.index(self.dictionary, start, len(self.dictionary))
+
+    def history_finder(self):
+        return BINARY_TREE if self.match_finder == SUFFIX_ARRAY else self.match_finder
+
+    def index(self, text, start, limit, table=None, first=0):
+        # match table with the positions before start indexed, from first on
+        # if table already has the ones before
+        first = max(0, first, start - LZ4.MAX_OFFSET)
+        if table is None and self.finder == BINARY_TREE:
+            table = BinaryTreeTable(text, limit, self.chain_depth, self.good_enough_size, first, self.hash_log)
+        elif table is None:
+            table = HashChainTable(len(text), self.hash_log)
+        elif self.finder == BINARY_TREE:
+            # the tree reads its keys from the text, which has grown
+            table.text = text
+            table.limit = limit
+            table.next = max(table.next, first)
+        for index in range(first, min(start, len(text) - LZ4.MINIMUM_LENGTH + 1)):
+            table.add(read_key(text, index)[0], index)
+        return table
+
+    def find_best(self, text, key):
+        if self.finder == BINARY_TREE:
+            matches = self.table.find(self.it)
+            if not matches:
+                return False, LZ4.MINIMUM_LENGTH - 1, -1
+            length, offset = matches[-1]
+            return True, length, offset
+        # newest candidates first, the chain mixes keys with the same hash
+        prev = self.table.prev
+        index = self.table.head[self.table.hash(key)]
         best_match_length = LZ4.MINIMUM_LENGTH - 1
         best_offset = -1
         match_found = False
-        if match_indices is not None:
-            for index in reversed(match_indices):
-                match_length, offset = self.iterate(text, index, self.it, best_match_length)
-                if offset == match_length == 0:
-                    break
-                if match_length > best_match_length:
+        depth = self.chain_depth
+        # the key and the 4 bytes after it, candidates are compared with it
+        # word by word inline, most matches end within it
+        word = read_word(text, self.it)[0]
+        while depth and 0 < self.it - index <= LZ4.MAX_OFFSET:
+            depth -= 1
+            # cheap test first, a worse candidate can't extend past the best length
+            if text[index + best_match_length] == text[self.it + best_match_length]:
+                difference = read_word(text, index)[0] ^ word
+                if difference & 0xFFFFFFFF:
+                    # another key with the same hash
+                    index = prev[index & HashChainTable.WINDOW_MASK]
+                    continue
+                if difference:
+                    length = ((difference & -difference).bit_length() - 1) >> 3
+                else:
+                    length = WORD_SIZE + match_length(text, index + WORD_SIZE, self.it + WORD_SIZE, self.match_limit)
+                if length > best_match_length:
                     match_found = True
-                    best_match_length = match_length
-                    best_offset = offset
-                    if best_match_length >= LZ4.GOOD_ENOUGH_SIZE:
+                    best_match_length = length
+                    best_offset = self.it - index
+                    if best_match_length >= self.good_enough_size:
                         break
+            index = prev[index & HashChainTable.WINDOW_MASK]
 
         return match_found, best_match_length, best_offset
 
-    def iterate(self, text, match_index, literal_index, best_length):
-        match_length = LZ4.MINIMUM_LENGTH
-        offset = literal_index - match_index
-        if offset > LZ4.MAX_OFFSET :
-            return 0, 0
-        left_index = match_index + best_length 
-        right_index = literal_index + best_length 
-        # Possible but not necessary worse candidate   
-        if right_index < len(text) and text[left_index]  != text[right_index]:# this is a worse candidate 
-            return -1, -1 
-        k = match_index + LZ4.MINIMUM_LENGTH
-        j = literal_index + LZ4.MINIMUM_LENGTH
-        # search buffer
-
-        while j < len(text) and text[j] == text[k]: 
-            j += 1
-            k += 1
-            match_length += 1
-        return match_length, offset
-
-       
-
-    def compress(self, text):
-        self.it = 0
-        blocks = bytearray()
-        distances = [1] * len(text) # preallocate 
-        lengths = [1] * len(text) 
-        # This is the first parsing loop 
-        # where we find maximum length for each byte 
-        last_length = 1
-        last_offset = 1 
-        pbar = tqdm(range(len(text) - LZ4.MINIMUM_LENGTH))
-        for self.it in pbar: 
-            literal = text[self.it:self.it + LZ4.MINIMUM_LENGTH]
+    def find_all(self, text, begin, stop, lengths, distances, base):
+        # longest match of every position begin <= i < stop into lengths and
+        # distances[i - base], walking the hash chains or the binary tree.
+        # Calls go on from each other, a long match is shared with the
+        # positions inside it across them
+        last_length = self.last_length
+        last_offset = self.last_offset
+        for self.it in range(begin, stop):
+            key = read_key(text, self.it)[0]
             match_length = last_length 
             offset = last_offset  
             if last_length > LZ4.MIN_SHARED_MATCH_LENGTH:  
                 match_found = True 
             else:
-                match_found, match_length, offset = self.find_best(text, literal)
+                match_found, match_length, offset = self.find_best(text, key)
             if match_found: # match found 
-               distances[self.it] = offset 
-               lengths[self.it] = match_length  
+               distances[self.it - base] = offset
+               lengths[self.it - base] = match_length
                last_length = match_length - 1 
-               last_offset = offset + 1
-            self.table.add(literal, self.it)
-        costs = [1] * (len(text) + 1)
-        matches = [False] * len(text) # contains if it is a literal or a match 
+               last_offset = offset
+            self.table.add(key, self.it)
+        self.last_length = last_length
+        self.last_offset = last_offset
+
+    def shortest_path(self, pos, stop, end, lengths, base, pending):
+        # Forward shortest path over the positions pos..stop with the exact
+        # LZ4 costs, returns the matches on it as (position, length). Offsets
+        # always take 2 bytes, so any prefix of the longest match is as good
+        # as the best match of that length: every length from 4 to the
+        # longest is an edge. Each sequence costs a token, its literals with
+        # their length bytes, the offset and the match length bytes.
+        #
+        # A position has two states: right after a match (match_cost) and in
+        # a literal run. A run costs 1 per literal plus a length byte once it
+        # reaches 15 and every 255 after. Of two runs through the same
+        # position the cheaper one stays ahead (length bytes come at most one
+        # apart) and of two equal ones the one whose next length byte is
+        # further, so one run per position is enough and the path is exact.
+        # A match reaching good_enough_size is taken as a whole, the
+        # positions it covers are skipped. pending literals before pos are
+        # still to be emitted, they start the first run.
+        #
+        # Positions are relative to pos, matches are cut at stop.
+        last = end - LZ4.MFLIMIT - pos # matches start before it
+        size = stop - pos
+        infinite = 1 << 62
+        match_cost = array('q', [infinite]) * (size + 1)
+        match_from = array('i', [0]) * (size + 1) # position and length of the match ending here
+        match_size = array('i', [0]) * (size + 1)
+        match_run = array('i', [0]) * (size + 1) # start of the literal run before it
+        # literal run state: cost, literals left before the next length byte
+        # and where it starts
+        cost = 0
+        if pending < 15:
+            room = 14 - pending
+        else:
+            room = 254 - (pending - 15) % 255
+        run = -pending
+        if not pending:
+            match_cost[0] = 0
+        shift = pos - base
+        i = 0
+        while i < size:
+            if match_cost[i] < cost or (match_cost[i] == cost and room < 14):
+                # empty run after the match ending here
+                cost = match_cost[i]
+                room = 14
+                run = i
+            length = min(lengths[i + shift], size - i)
+            if i < last and length >= LZ4.MIN_MATCH_LENGTH:
+                if length >= self.good_enough_size:
+                    k = i + length
+                    c = cost + 3 + (1 + (length - 19) // 255 if length >= 19 else 0)
+                    if c < match_cost[k]:
+                        match_cost[k] = c
+                        match_from[k] = i
+                        match_size[k] = length
+                        match_run[k] = run
+                    i = k
+                    cost = infinite
+                    continue
+                # 1 token + 2 offset, a length byte from 19 and every 255 after
+                c = cost + 3
+                low = LZ4.MIN_MATCH_LENGTH
+                high = 18
+                while low <= length:
+                    for k in range(i + low, i + min(high, length) + 1):
+                        if c < match_cost[k]:
+                            match_cost[k] = c
+                            match_from[k] = i
+                            match_size[k] = k - i
+                            match_run[k] = run
+                    c += 1
+                    low = high + 1
+                    high += 255
+            # the literal at i
+            if room:
+                cost += 1
+                room -= 1
+            else:
+                cost += 2
+                room = 254
+            i += 1
+        if match_cost[size] < cost:
+            run = size
+        # walk back from the last literal run
+        matches = []
+        k = run
+        while k > 0:
+            i = match_from[k]
+            matches.append((pos + i, match_size[k]))
+            k = match_run[k]
+        matches.reverse()
+        return matches
+
+    def backward(self, pos, stop, end, lengths, base, pending):
+        # takes the longest match or a literal at every position, from the
+        # end of the window. Returns the matches taken from pos on as
+        # (position, length)
+        top = stop if stop < end else end - LZ4.END_LITERALS
+        size = stop - pos
+        shift = pos - base
+        costs = array('q', [1]) * (size + 1)
+        matches = bytearray(size) # contains if it is a literal or a match
         # In this second pass we compute the costs of each match 
         # thus calculating if it is better to output the literal 
         # or the match 
-        pbar = tqdm(reversed(list(enumerate(lengths[:-LZ4.END_LITERALS]))), total=len(lengths) - LZ4.END_LITERALS)
         num_literals = LZ4.END_LITERALS
-        for i, length in pbar: 
+        for i in range(top - pos - 1, -1, -1):
+           length = min(lengths[i + shift], size - i)
+           if length < LZ4.MIN_MATCH_LENGTH:
+               length = 1
            
            # First we calculate the cost of saving the current literal 
            # inside the block. It includes the cost of storing multiple literals 
@@ -144,29 +288,115 @@ class LZ4:
                costs[i] = match_cost
                matches[i] = True 
            else:
-               costs[i] = literal_cost 
-            
-
-        
-        # This is the third pass, were we output the corresponding 
-        # blocks 
-        self.it = 0
-        last_match = 0 
-        with tqdm(total=len(text)) as pbar:
-            while self.it < len(text):
-                if matches[self.it]:
-                    LZ4.createBlock(blocks, text[last_match:self.it], lengths[self.it], distances[self.it])
-                    pbar.update(lengths[self.it])
-                    self.it += lengths[self.it]
-                    last_match = self.it 
-                else:
-                    self.it += 1 
-                    pbar.update(1)
-        LZ4.createBlock(blocks, text[last_match:self.it], 0, 0, last_block=True)
+               costs[i] = literal_cost
+        taken = []
+        i = 0
+        while i < top - pos:
+            if matches[i]:
+                length = min(lengths[i + shift], size - i)
+                taken.append((pos + i, length))
+                i += length
+            else:
+                i += 1
+        return taken
 
-    
+    def compress(self, text, start=0, resume=False):
+        blocks = bytearray()
+        for code in self.compress_iter(text, start, resume):
+            blocks += code
         return blocks
 
+    def compress_iter(self, text, start=0, resume=False):
+        # bytes before start are history, they are only indexed. Without
+        # history the loaded dictionary (if any) is the history. With resume
+        # text goes on from the previous call's, whose table is kept.
+        #
+        # Yields the block in pieces, one per parse window: the matches of
+        # window_size + window_overlap positions are found and parsed, the
+        # sequences starting in the first window_size positions are emitted
+        # and the next window starts after the last of them. The overlap lets
+        # the parse see past the cut. Memory only depends on the window size,
+        # the text itself can be a mapped file
+        table = None
+        first = 0
+        if resume and self.table is not None:
+            table = self.table
+            first = self.indexed
+        elif self.dictionary and not start:
+            text, start = with_dictionary(self.dictionary, text)
+            if self.dictionary_table is not None:
+                table = self.dictionary_table.copy()
+                first = start - LZ4.MINIMUM_LENGTH + 1
+        text, view = as_buffer(text, in_place=True)
+        end = len(text)
+        # matches end before the last literals and start before MFLIMIT
+        self.match_limit = end - LZ4.END_LITERALS
+        last = max(start, end - LZ4.MFLIMIT)
+        self.finder = self.history_finder() if start else self.match_finder
+        if self.finder == SUFFIX_ARRAY:
+            # nothing to resume from
+            self.table = None
+        else:
+            self.table = self.index(text, start, self.match_limit, table, first)
+            self.last_length = 1
+            self.last_offset = 1
+        self.it = start
+        size = min(self.window_size + self.window_overlap, end - start)
+        # per position data of the positions from base on
+        lengths = array('i', [1]) * size
+        distances = array('i', [1]) * size
+        base = start
+        found = start # matches are known up to it
+        pos = start # the parse goes on from here
+        literals = start # first literal not emitted yet
+        progress = self.progress
+        progress.start(end - start)
+        try:
+            while True:
+                stop = min(pos + size, end)
+                if pos > base:
+                    # keep what is known past pos
+                    kept = max(0, found - pos)
+                    lengths[:kept] = lengths[pos - base:pos - base + kept]
+                    distances[:kept] = distances[pos - base:pos - base + kept]
+                    lengths[kept:] = array('i', [1]) * (size - kept)
+                    base = pos
+                # This is the first parsing loop
+                # where we find maximum length for each byte
+                if found < min(stop, last):
+                    if self.finder == SUFFIX_ARRAY:
+                        lz_suffix.longest_matches(text, found, min(stop, last), self.match_limit,
+                                                  lengths, distances, origin=base)
+                    else:
+                        self.find_all(text, found, min(stop, last), lengths, distances, base)
+                    found = min(stop, last)
+                if self.parser == SHORTEST_PATH:
+                    matches = self.shortest_path(pos, stop, end, lengths, base, pos - literals)
+                else:
+                    matches = self.backward(pos, stop, end, lengths, base, pos - literals)
+                if stop < end:
+                    # the rest is parsed again with the next window
+                    cut = pos + self.window_size
+                    matches = [match for match in matches if match[0] < cut]
+                    next_pos = matches[-1][0] + matches[-1][1] if matches else cut
+                # This is the third pass, were we output the corresponding
+                # blocks
+                blocks = bytearray()
+                for i, length in matches:
+                    LZ4.createBlock(blocks, view[literals:i], length, distances[i - base])
+                    literals = i + length
+                if stop == end:
+                    LZ4.createBlock(blocks, view[literals:], 0, 0, last_block=True)
+                    progress.update(end - pos)
+                    yield blocks
+                    break
+                progress.update(next_pos - pos)
+                pos = next_pos
+                yield blocks
+        finally:
+            progress.close()
+        self.indexed = max(min(start, end - LZ4.MINIMUM_LENGTH + 1), end - LZ4.MFLIMIT)
+
     @staticmethod
     def writeLSIC(length):
         blocks = bytearray()
@@ -204,93 +434,11 @@ class LZ4:
         if match_length >= 15:
             blocks += LZ4.writeLSIC(match_length - 15)
 
-    def readToken(self, code):
-        self.literalLength = code[self.it] >> 4 # 4 highest bits
-        self.matchLength = code[self.it] & 0x0F # 4 lowest bits
-
-        self.it += 1
-
-    def readLiteral(self, code):
-        literal = code[self.it:self.it + self.literalLength]
-        self.it += self.literalLength
-        #print('Literal found:', literal)
-        return literal
-
-    def readLiteralLenght(self, code):
-        self.literalLength = self.readLSIC(code, self.literalLength)
-        #print('Literal length:', self.literalLength)
-
-
-    def readMatchLength(self, code):
-        self.matchLength = self.readLSIC(code, self.matchLength) + LZ4.MIN_MATCH_LENGTH
-        #print('Match length:', self.matchLength)
-
-    def readOffset(self, code):
-        higher = code[self.it + 1]
-        lower = code[self.it]
-        #print('Offset hex:', code[self.it:self.it + 1])
-        self.offset = (higher << 8) + lower
-        self.it += 2
-        #print('Offset:', self.offset)
-
-    def readLSIC(self, code, initialLength):
-        length = initialLength
-        currentByte = initialLength
-        # 15 == 4 bits
-        if currentByte >= 15:
-            currentByte = code[self.it]
-            # 8 bits
-            while currentByte >= 255:
-                length += currentByte
-                self.it += 1
-                currentByte = code[self.it]
-
-            length += currentByte
-            self.it += 1 # next block
-
-        return length
-
-    def readMatch(self, text):
-        #print('Text Length:', len(text))
-        #print('Offset:', self.offset)
-        pos = len(text) - self.offset
-        for i in range(self.matchLength):
-            text.append(text[pos + i])
-
-
-    def decompress(self, code):
-        self.it = 0
-        text = bytearray()
-        with tqdm(total=len(code)) as pbar:
-            it_old = self.it
-            while self.it < len(code):
-
-                pbar.update(self.it - it_old)
-                it_old = self.it
-                self.readToken(code)
-                #print('It:', self.it)
-                self.readLiteralLenght(code)
-                #print('It:', self.it)
-                literal = self.readLiteral(code)
-                #print('It:', self.it)
-                text += literal
-                if self.it < len(code): # in case it is the last token
-                    self.readOffset(code)
-                    #print('It:', self.it)
-                    self.readMatchLength(code)
-                    #print('It:', self.it)
-                    # add
-                    self.readMatch(text)
-                    #print('It:', self.it)
-                # print(offsets[k], "==", self.offset)
-                #print('Block:', code[it_old:self.it])
-                #print('Text:', text)
-
-
-        return text
-
-
+    # DECOMPRESSION
 
+    def decompress(self, code, prefix=b''):
+        # prefix is the already decoded history that matches may refer to
+        return lz_decoder.decompress(code, prefix=prefix)
 
 
 
@@ -298,8 +446,12 @@ class LZ4:
 
 
 def main():
-    # create instance on encoder
-    encoder = LZ4()
+    # create instance on encoder, with a progress bar if tqdm is installed
+    try:
+        progress = TqdmProgress()
+    except ImportError:
+        progress = None
+    encoder = LZ4(progress=progress)
     # if we don't have enough argumemts return
     if len(sys.argv) < 3:
         print('Not enough arguments provided')
@@ -309,19 +461,21 @@ def main():
         fd = open(file, 'rb')
         print('Compressing file', file)
         # read file and encode
-        text = fd.read()
-        code = encoder.compress(text)
-        print('Ratio:', len(text) / len(code))
-        # create new file
+        text = map_file(fd)
+        # the block is written as it is produced
+        written = 0
         with open(file + LZ4.ENCODE_EXT, 'wb') as out:
-            out.write(code)
+            for code in encoder.compress_iter(text):
+                out.write(code)
+                written += len(code)
+        print('Ratio:', len(text) / written)
         fd.close()
     # if we want to decompress we read the specific file
     elif sys.argv[1] == '-d':
         file = sys.argv[2]
         fd = open(file, 'rb')
         print('Decompressing file', file)
-        text = encoder.decompress(fd.read())
+        text = encoder.decompress(map_file(fd))
         # create new file
         with open(".".join(file.split('.')[:-1]), 'wb') as out:
             out.write(text)
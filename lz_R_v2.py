@@ -1,6 +1,8 @@
 import collections
 import sys
 import cProfile
+from lz_common import as_buffer, map_file, match_length
+import lz_decoder
 
 
 class LinkedHashTable:
@@ -64,7 +66,6 @@ class LZ4:
 
     @staticmethod
     def iterate(text, match_index, literal_index, best_length):
-        match_length = 4
         offset = literal_index - match_index
         if offset > 65535 :
             return 0, 0
@@ -72,19 +73,12 @@ class LZ4:
         right_index = literal_index + best_length
         if right_index < LZ4.LENGTH and text[left_index]  != text[right_index]:# this is a worse candidate
             return -1, -1
-        k = match_index + 4
-        j = literal_index + 4
         # search buffer
-
-        while j < LZ4.LENGTH and text[j] == text[k]:
-            j += 1
-            k += 1
-        # adding k - match_length instead of match_length += 1 improves
-        # speed by a little
-        return k - match_index, offset
+        return 4 + match_length(text, match_index + 4, literal_index + 4, LZ4.LENGTH), offset
 
 
     def compress(self, text):
+        text, view = as_buffer(text)
         iterator = 0
         blocks = bytearray()
         last_match = 0
@@ -106,7 +100,7 @@ class LZ4:
                     else:
                         break
                 # print('Match found with length', match_length, 'and offset', offset)
-                LZ4.createBlock(blocks, text[last_match:iterator], iterator - last_match, match_length, offset)
+                LZ4.createBlock(blocks, view[last_match:iterator], iterator - last_match, match_length, offset)
                 self.table.add(literal, iterator) # remove line to increase speed
                 # remove for increased speed, but less compression
                 for blockByte in range(iterator, match_length + iterator, 1):
@@ -117,7 +111,7 @@ class LZ4:
                 self.table.add(literal, iterator)
                 iterator += 1
 
-        LZ4.createBlock(blocks, text[last_match:iterator], iterator - last_match, 0, 0, last_block=True)
+        LZ4.createBlock(blocks, view[last_match:iterator], iterator - last_match, 0, 0, last_block=True)
         return blocks
 
     @staticmethod
@@ -160,65 +154,9 @@ class LZ4:
 
     # DECOMPRESSION
 
-    @staticmethod
-    def readVariableLength(iterator, code):
-        length = 15
-        s = 255
-        while s == 255:
-            s = code[iterator]
-            iterator += 1
-            length += s
-
-        return length, iterator
-
-
-
-    def decompress(self, code):
-        iterator = 0
-        out = bytearray()
-        LZ4.LENGTH = len(code)
-        while iterator != LZ4.LENGTH:
-            # first read token
-            token = code[iterator]
-            # increment iterator
-            iterator += 1
-            # read literal length
-            length = token >> 4
-            # read literals
-            if length == 15:
-                length, iterator = LZ4.readVariableLength(iterator, code)
-            out += code[iterator:iterator + length]
-            iterator += length
-            # after literal always check if we are in the last block
-
-            if iterator == LZ4.LENGTH:
-                break
-            # read offset
-            offset = code[iterator] + (code[iterator + 1] << 8)
-            iterator += 2
-            # read match length
-            length = token & 0x0F
-            # read matches
-            if length == 15:
-                length, iterator = LZ4.readVariableLength(iterator, code)
-            # always add 4 to length (MINMATCH)
-            length += 4
-            # read match
-            initialLength = len(out)
-            # begin representes where the match starts
-            pos = initialLength - offset
-            # match distance is the distance of begin to the end of text
-            distance = initialLength - pos
-            # preacollate
-            out +=  b"0" * length
-            if distance < length:
-                for i in range(length):
-                    out[initialLength + i] = out[pos + i]
-            else:
-                out[initialLength:] = out[pos:pos + length]
-
-
-        return out
+    def decompress(self, code, prefix=b''):
+        # prefix is the already decoded history that matches may refer to
+        return lz_decoder.decompress(code, prefix=prefix)
 
 
 
@@ -237,7 +175,7 @@ def main():
         fd = open(file, 'rb')
         print('Compressing file', file)
         # read file and encode
-        text = fd.read()
+        text = map_file(fd)
         code = encoder.compress(text)
         print('Ratio:', len(text) / len(code))
         print('Compressed correctly:', text == encoder.decompress(code))
@@ -250,7 +188,7 @@ def main():
         file = sys.argv[2]
         fd = open(file, 'rb')
         print('Decompressing file', file)
-        text = encoder.decompress(fd.read())
+        text = encoder.decompress(map_file(fd))
         # create new file
         with open(".".join(file.split('.')[:-1]), 'wb') as out:
             out.write(text)
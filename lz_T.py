@@ -1,4 +1,6 @@
 import sys
+from lz_common import as_buffer, map_file, match_length
+import lz_decoder
 
 class LZ4:
 
@@ -20,6 +22,7 @@ class LZ4:
 
 
     def compress(self, text):
+        text, view = as_buffer(text)
         text_length = len(text)
         iterator = int(text_length * 0.765)
         blocks = bytearray()
@@ -38,14 +41,9 @@ class LZ4:
                 offset = iterator - match_start
                 # continue if offset is within range
                 if offset <= 65535:
-                    match_index = match_start + 6
                     # get longest match length
-                    while literal_end < text_length and text[match_index] == text[literal_end]:
-                        match_index += 1
-                        literal_end += 1
-
-                    length = match_index - match_start
-                    LZ4.createBlock(blocks, text[last_match:iterator], iterator - last_match, length, offset)
+                    length = 6 + match_length(text, match_start + 6, literal_end, text_length)
+                    LZ4.createBlock(blocks, view[last_match:iterator], iterator - last_match, length, offset)
                     iterator += length
                     last_match = iterator
                 # skip match
@@ -58,7 +56,7 @@ class LZ4:
                 iterator += 1
 
 
-        LZ4.createBlock(blocks, text[last_match:iterator], iterator - last_match, 0, 0, last_block=True)
+        LZ4.createBlock(blocks, view[last_match:iterator], iterator - last_match, 0, 0, last_block=True)
         return blocks
 
     @staticmethod
@@ -101,65 +99,9 @@ class LZ4:
 
     # DECOMPRESSION
 
-    @staticmethod
-    def readVariableLength(iterator, code):
-        length = 15
-        s = 255
-        while s == 255:
-            s = code[iterator]
-            iterator += 1
-            length += s
-
-        return length, iterator
-
-
-
-    def decompress(self, code):
-        iterator = 0
-        out = bytearray()
-        LZ4.LENGTH = len(code)
-        while iterator != LZ4.LENGTH:
-            # first read token
-            token = code[iterator]
-            # increment iterator
-            iterator += 1
-            # read literal length
-            length = token >> 4
-            # read literals
-            if length == 15:
-                length, iterator = LZ4.readVariableLength(iterator, code)
-            out += code[iterator:iterator + length]
-            iterator += length
-            # after literal always check if we are in the last block
-
-            if iterator == LZ4.LENGTH:
-                break
-            # read offset
-            offset = code[iterator] + (code[iterator + 1] << 8)
-            iterator += 2
-            # read match length
-            length = token & 0x0F
-            # read matches
-            if length == 15:
-                length, iterator = LZ4.readVariableLength(iterator, code)
-            # always add 4 to length (MINMATCH)
-            length += 4
-            # read match
-            initialLength = len(out)
-            # begin representes where the match starts
-            pos = initialLength - offset
-            # match distance is the distance of begin to the end of text
-            distance = initialLength - pos
-            # preacollate
-            out +=  b"0" * length
-            if distance < length:
-                for i in range(length):
-                    out[initialLength + i] = out[pos + i]
-            else:
-                out[initialLength:] = out[pos:pos + length]
-
-
-        return out
+    def decompress(self, code, prefix=b''):
+        # prefix is the already decoded history that matches may refer to
+        return lz_decoder.decompress(code, prefix=prefix)
 
 
 
@@ -178,7 +120,7 @@ def main():
         fd = open(file, 'rb')
         print('Compressing file', file)
         # read file and encode
-        text = fd.read()
+        text = map_file(fd)
         code = encoder.compress(text)
         print('Ratio:', len(text) / len(code))
         # create new file
@@ -190,7 +132,7 @@ def main():
         file = sys.argv[2]
         fd = open(file, 'rb')
         print('Decompressing file', file)
-        text = encoder.decompress(fd.read())
+        text = encoder.decompress(map_file(fd))
         # create new file
         with open(".".join(file.split('.')[:-1]), 'wb') as out:
             out.write(text)
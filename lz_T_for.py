@@ -2,6 +2,11 @@ import collections
 import sys
 import cProfile
 import itertools as it
+from lz_common import (HASH_LOG, KEY_READERS, as_buffer, hash_params, hash_table, map_file, match_length,
+                       with_dictionary)
+import lz_decoder
+
+read_key = KEY_READERS[4]
 
 
 class LZ4:
@@ -13,51 +18,86 @@ class LZ4:
     MINIMUM_LENGTH = 4
     GOOD_ENOUGH_SIZE = 64
     MAX_OFFSET = 65535 # 2 BYTES = 65535
+    LAST_LITERALS = 5 # last 5 bytes of a block are always literals
+    MFLIMIT = 12 # last match must start at least 12 bytes before the end
 
-    def __init__(self):
+    def __init__(self, hash_log=HASH_LOG):
         self.literalLength = 0
         self.matchLength = 0
         self.offset = 0
         self.it = 0
-        self.table = {}
-
-    def find_best(self, text, literal):
-        match_index = self.table.get(literal)
-        if match_index is not None:
-            literal_index = self.it
-            match_length = LZ4.MINIMUM_LENGTH
-            offset = literal_index - match_index
-            if offset > LZ4.MAX_OFFSET:
-                return False, 0, 0
-            k = match_index + LZ4.MINIMUM_LENGTH
-            j_ini = literal_index + LZ4.MINIMUM_LENGTH
+        self.hash_log = hash_log
+        self.table = None
+        self.indexed = 0 # end of the previous text's indexed positions
+        self.dictionary = b''
+        self.dictionary_table = None
+
+    def load_dictionary(self, dictionary):
+        # indexes the dictionary once, compress() then starts every call from
+        # a copy of its table as if the text followed the dictionary
+        self.dictionary, start = with_dictionary(dictionary, b'')
+        self.dictionary_table = self.index(self.dictionary, start)
+
+    def index(self, text, start, table=None, first=0):
+        # table with the positions before start indexed, from first on if the
+        # table already has the ones before
+        self.prime, self.mask, self.shift = hash_params(LZ4.MINIMUM_LENGTH, self.hash_log)
+        if table is None:
+            table = hash_table(self.hash_log, len(text))
+        for index in range(max(0, first, start - LZ4.MAX_OFFSET), min(start, len(text) - LZ4.MINIMUM_LENGTH + 1)):
+            table[((read_key(text, index)[0] * self.prime) & self.mask) >> self.shift] = index
+        return table
+
+    def find_best(self, text, key):
+        # the table keeps the last position of every hash, the candidate may
+        # be a collision so its key is compared first
+        h = ((key * self.prime) & self.mask) >> self.shift
+        match_index = self.table[h]
+        self.table[h] = self.it
+        literal_index = self.it
+        offset = literal_index - match_index
+        if 0 < offset <= LZ4.MAX_OFFSET and read_key(text, match_index)[0] == key:
+            # many matches end right after the key, skip the call for them
+            if text[literal_index + LZ4.MINIMUM_LENGTH] != text[match_index + LZ4.MINIMUM_LENGTH]:
+                return True, LZ4.MINIMUM_LENGTH, offset
             # search buffer
-            #for j, k in zip(range(j_ini,len(text)),range(k_ini,len(text))):
-            for j in range(j_ini,len(text)):
-                if text[j] == text[k]:
-                    k +=1
-                    match_length +=1
-                else:
-                    break
-            return True, match_length, offset
+            length = LZ4.MINIMUM_LENGTH + match_length(text, match_index + LZ4.MINIMUM_LENGTH,
+                                                       literal_index + LZ4.MINIMUM_LENGTH, self.match_limit)
+            return True, length, offset
 
         return False, 0, 0
 
 
 
-    def compress(self, text):
-        self.it = 0
-        blocks = bytearray()
-        last_match = 0
+    def compress(self, text, start=0, resume=False):
+        # bytes before start are history, they are only indexed. Without
+        # history the loaded dictionary (if any) is the history. With resume
+        # text goes on from the previous call's, whose table is kept
+        if resume and self.table is not None:
+            self.table = self.index(text, start, self.table, self.indexed)
+        elif self.dictionary and not start:
+            text, start = with_dictionary(self.dictionary, text)
+            # only keys running past the dictionary are left to index
+            self.table = self.index(text, start, self.dictionary_table[:], start - LZ4.MINIMUM_LENGTH + 1)
+        else:
+            self.table = None
+        text, view = as_buffer(text, in_place=True)
         len_text = len(text)
-        while self.it < len_text:
-            literal = text[self.it:self.it + LZ4.MINIMUM_LENGTH]
-            match_found, match_length, offset = self.find_best(text, literal)
+        if self.table is None:
+            self.table = self.index(text, start)
+        self.it = start
+        blocks = bytearray()
+        last_match = start
+        self.match_limit = len_text - LZ4.LAST_LITERALS
+        match_end = len_text - LZ4.MFLIMIT
+        while self.it < match_end:
+            key = read_key(text, self.it)[0]
+            match_found, match_length, offset = self.find_best(text, key)
 
             if match_found: # match found
 
                 # print('Match found with length', match_length, 'and offset', offset)
-                LZ4.createBlock(blocks, text[last_match:self.it], match_length, offset)
+                LZ4.createBlock(blocks, view[last_match:self.it], match_length, offset)
                 #self.table.add(literal, self.it) # remove line to increase speed
                 # remove for increased speed, but less compression
                 #for blockByte in range(self.it, match_length + self.it, 1):
@@ -66,10 +106,10 @@ class LZ4:
                 self.it += match_length
                 last_match = self.it
             else:
-                self.table[literal] = self.it
                 self.it += 1
 
-        LZ4.createBlock(blocks, text[last_match:self.it], 0, 0, last_block=True)
+        self.indexed = min(self.it, len_text - LZ4.MINIMUM_LENGTH + 1)
+        LZ4.createBlock(blocks, view[last_match:], 0, 0, last_block=True)
         return blocks
 
     @staticmethod
@@ -110,96 +150,11 @@ class LZ4:
         if match_length >= 15:
             blocks += LZ4.writeLSIC(match_length - 15)
 
-    def readToken(self, code):
-        self.literalLength = code[self.it] >> 4 # 4 highest bits
-        self.matchLength = code[self.it] & 0x0F # 4 lowest bits
-
-        self.it += 1
-
-    def readLiteral(self, code):
-        literal = code[self.it:self.it + self.literalLength]
-        self.it += self.literalLength
-        #print('Literal found:', literal)
-        return literal
-
-    def readLiteralLenght(self, code):
-        self.literalLength = self.readLSIC(code, self.literalLength)
-        #print('Literal length:', self.literalLength)
-
-
-    def readMatchLength(self, code):
-        self.matchLength = self.readLSIC(code, self.matchLength) + LZ4.MIN_MATCH_LENGTH
-        #print('Match length:', self.matchLength)
-
-    def readOffset(self, code):
-        higher = code[self.it + 1]
-        lower = code[self.it]
-        #print('Offset hex:', code[self.it:self.it + 1])
-        self.offset = (higher << 8) + lower
-        self.it += 2
-        #print('Offset:', self.offset)
-
-    def readLSIC(self, code, initialLength):
-        length = initialLength
-        currentByte = initialLength
-        # 15 == 4 bits
-        if currentByte >= 15:
-            currentByte = code[self.it]
-            # 8 bits
-            while currentByte >= 255:
-                length += currentByte
-                self.it += 1
-                currentByte = code[self.it]
-
-            length += currentByte
-            self.it += 1 # next block
-
-        return length
-
-    def readMatch(self, text):
-        #print('Text Length:', len(text))
-        #print('Offset:', self.offset)
-        initialLength = len(text)
-        # begin representes where the match starts
-        pos = len(text) - self.offset
-        # match distance is the distance of begin to the end of text
-        distance = len(text) - pos
-        # preacollate
-        text +=  b"0" * self.matchLength
-        if distance < self.matchLength:
-            for i in range(self.matchLength):
-                text[initialLength + i] = text[pos + i]
-        else:
-            text[initialLength:] = text[pos:pos + self.matchLength]
-
-
-
-    def decompress(self, code):
-        self.it = 0
-        text = bytearray()
-        len_code = len(code)
-        while self.it < len_code:
-            self.readToken(code)
-            #print('It:', self.it)
-            self.readLiteralLenght(code)
-            #print('It:', self.it)
-            literal = self.readLiteral(code)
-            #print('It:', self.it)
-            text += literal
-            if self.it < len(code): # in case it is the last token
-                self.readOffset(code)
-                #print('It:', self.it)
-                self.readMatchLength(code)
-                #print('It:', self.it)
-                # add
-                self.readMatch(text)
-
-
-
-        return text
-
-
+    # DECOMPRESSION
 
+    def decompress(self, code, prefix=b''):
+        # prefix is the already decoded history that matches may refer to
+        return lz_decoder.decompress(code, prefix=prefix)
 
 
 
@@ -218,7 +173,7 @@ def main():
         fd = open(file, 'rb')
         print('Compressing file', file)
         # read file and encode
-        text = fd.read()
+        text = map_file(fd)
         code = encoder.compress(text)
         print('Ratio:', len(text) / len(code))
         # create new file
@@ -230,7 +185,7 @@ def main():
         file = sys.argv[2]
         fd = open(file, 'rb')
         print('Decompressing file', file)
-        text = encoder.decompress(fd.read())
+        text = encoder.decompress(map_file(fd))
         # create new file
         with open(".".join(file.split('.')[:-1]), 'wb') as out:
             out.write(text)
@@ -0,0 +1,204 @@
+import functools
+import sys
+
+import lz
+import lz_R
+import lz_R_dp
+import lz_T_for
+import lz_decoder
+from lz_common import BINARY_TREE, DICTIONARY_SIZE, SUFFIX_ARRAY, map_file
+
+
+# Single entry point to every compressor variant. Levels go from fastest to
+# best ratio:
+#
+#   1      greedy, 8 byte keys (lz.py)
+#   2      greedy, 4 byte keys (lz_T_for.py)
+#   3 - 9  lazy matching over hash chains (lz_R.py), deeper chains, more
+#          lookahead and a higher good enough length on every level
+#   10-12  optimal parsing (lz_R_dp.py), a shortest path over the exact
+#          sequence costs. Level 10 finds its matches with a suffix array
+#          (lz_suffix.py), or a binary tree with a dictionary or history,
+#          11 and 12 with a binary tree
+#
+# Negative levels are greedy with 8 byte keys and an acceleration of
+# 1 - level, as in the lz4 frame API: the further below zero, the faster the
+# compressor skips over data that doesn't match.
+#
+# Every level produces standard LZ4 blocks and shares the same decoder.
+# Data that doesn't compress (already compressed, encrypted) is detected on a
+# few samples before searching it and stored as a single run of literals.
+#
+# A preset dictionary (up to 64 KB, only its end is used when longer) acts as
+# history before the data: small inputs can match into it from their first
+# byte. The same dictionary has to be given to decompress.
+
+ENCODE_EXT = '.lz4'
+
+SAMPLE_SIZE = 4096 # bytes per incompressibility sample
+SAMPLE_COUNT = 4 # samples spread over the input
+MIN_SAMPLE_SAVING = SAMPLE_SIZE // 64 # a sample saving less is incompressible
+
+MIN_LEVEL = 1
+MAX_LEVEL = 12
+DEFAULT_LEVEL = 9
+
+GREEDY = 'greedy'
+GREEDY_4 = 'greedy4'
+LAZY = 'lazy'
+OPTIMAL = 'optimal'
+
+# level -> (strategy, tuning knobs)
+LEVELS = {
+    1: (GREEDY, {'key_length': 8}),
+    2: (GREEDY_4, {}),
+    3: (LAZY, {'chain_depth': 4, 'lookahead': 1, 'good_enough_size': 32}),
+    4: (LAZY, {'chain_depth': 8, 'lookahead': 1, 'good_enough_size': 64}),
+    5: (LAZY, {'chain_depth': 16, 'lookahead': 2, 'good_enough_size': 128}),
+    6: (LAZY, {'chain_depth': 64, 'lookahead': 3, 'good_enough_size': 256}),
+    7: (LAZY, {'chain_depth': 256, 'lookahead': 4, 'good_enough_size': 512}),
+    8: (LAZY, {'chain_depth': 1024, 'lookahead': 5, 'good_enough_size': 1024}),
+    9: (LAZY, {'chain_depth': 20000, 'lookahead': 5, 'good_enough_size': 1024}),
+    10: (OPTIMAL, {'match_finder': SUFFIX_ARRAY}),
+    11: (OPTIMAL, {'chain_depth': 500, 'good_enough_size': 256, 'match_finder': BINARY_TREE}),
+    12: (OPTIMAL, {'chain_depth': 4096, 'good_enough_size': 1024, 'match_finder': BINARY_TREE}),
+}
+
+
+def compressor(level=DEFAULT_LEVEL, dict=None):
+    # returns a new encoder configured for the level, with the dictionary
+    # loaded if any
+    if isinstance(level, int) and level < 0:
+        encoder = lz.LZ4(acceleration=1 - level, **LEVELS[MIN_LEVEL][1])
+    elif level not in LEVELS:
+        raise ValueError('Invalid compression level %r, expected %d to %d or below 0' %
+                         (level, MIN_LEVEL, MAX_LEVEL))
+    else:
+        strategy, knobs = LEVELS[level]
+        if strategy == GREEDY:
+            encoder = lz.LZ4(**knobs)
+        elif strategy == GREEDY_4:
+            encoder = lz_T_for.LZ4(**knobs)
+        elif strategy == LAZY:
+            encoder = lz_R.LZ4(**knobs)
+        else:
+            encoder = lz_R_dp.LZ4(**knobs)
+    if dict:
+        encoder.load_dictionary(dict)
+    return encoder
+
+
+@functools.lru_cache(maxsize=16)
+def indexed_dictionary(level, dict):
+    # the dictionary as an encoder of the level loads it: its bytes and their
+    # match table. Neither changes afterwards, encoders copy the table
+    encoder = compressor(level, dict)
+    return encoder.dictionary, encoder.dictionary_table
+
+
+def dictionary_compressor(level, dict):
+    # a new encoder with the cached dictionary, so every message compressed
+    # with the same dictionary only indexes itself. Encoders keep state while
+    # they compress, each call (and thread) gets its own
+    encoder = compressor(level)
+    encoder.dictionary, encoder.dictionary_table = indexed_dictionary(level, dict)
+    return encoder
+
+
+def incompressible(data, start=0):
+    # compresses a few slices of data[start:] with the greedy compressor on 4
+    # byte keys, which skips fast over random data. The data is not worth
+    # searching if none of them shrinks. Inputs too small to sample are
+    # always searched
+    length = len(data) - start
+    if length < SAMPLE_SIZE * SAMPLE_COUNT:
+        return False
+    sampler = lz.LZ4(key_length=4)
+    step = (length - SAMPLE_SIZE) // (SAMPLE_COUNT - 1)
+    for sample in range(SAMPLE_COUNT):
+        begin = start + sample * step
+        code = sampler.compress(data[begin:begin + SAMPLE_SIZE])
+        if len(code) <= SAMPLE_SIZE - MIN_SAMPLE_SAVING:
+            return False
+    return True
+
+
+def literal_block(data, start=0):
+    # data[start:] as one run of literals, the cheapest valid block
+    view = memoryview(data)[start:]
+    blocks = bytearray()
+    lz.LZ4.createBlock(blocks, view, len(view), 0, 0, last_block=True)
+    return blocks
+
+
+def compress(data, level=DEFAULT_LEVEL, start=0, dict=None):
+    # start > 0 compresses data[start:] with data[:start] as history, which
+    # takes the place of the dictionary
+    if incompressible(data, start):
+        return literal_block(data, start)
+    if dict and not start:
+        encoder = dictionary_compressor(level, bytes(dict[-DICTIONARY_SIZE:]))
+    else:
+        encoder = compressor(level)
+    code = encoder.compress(data, start=start)
+    # never return more than the literals would take
+    if len(code) > len(data) - start:
+        stored = literal_block(data, start)
+        if len(stored) < len(code):
+            return stored
+    return code
+
+
+def decompress(code, size=None, prefix=b'', dict=None):
+    # prefix is the history the data was compressed after, a dictionary
+    # is the same thing for data compressed without one
+    if dict and not prefix:
+        prefix = dict[-DICTIONARY_SIZE:]
+    return lz_decoder.decompress(code, size=size, prefix=prefix)
+
+
+def main():
+    # usage: lz_api.py -c|-d file [-1 .. -12 | --fast=N] [-D dictionary]
+    if len(sys.argv) < 3:
+        print('Not enough arguments provided')
+        return
+    level = DEFAULT_LEVEL
+    dictionary = None
+    args = iter(sys.argv[3:])
+    for arg in args:
+        if arg == '-D':
+            name = next(args, None)
+            if name is None:
+                print('Missing dictionary file')
+                return
+            with open(name, 'rb') as fd:
+                dictionary = fd.read()
+        elif arg.startswith('-') and arg[1:].isdigit():
+            level = int(arg[1:])
+        elif arg.startswith('--fast=') and arg[7:].isdigit() and int(arg[7:]) > 0:
+            level = -int(arg[7:])
+        else:
+            print('Unknown option', arg)
+            return
+    if sys.argv[1] == '-c':
+        file = sys.argv[2]
+        with open(file, 'rb') as fd:
+            print('Compressing file', file, 'at level', level)
+            text = map_file(fd)
+            code = compress(text, level=level, dict=dictionary)
+            print('Ratio:', len(text) / len(code))
+        with open(file + ENCODE_EXT, 'wb') as out:
+            out.write(code)
+    elif sys.argv[1] == '-d':
+        file = sys.argv[2]
+        with open(file, 'rb') as fd:
+            print('Decompressing file', file)
+            text = decompress(map_file(fd), dict=dictionary)
+        with open(".".join(file.split('.')[:-1]), 'wb') as out:
+            out.write(text)
+    else:
+        print('Unknown command', sys.argv[1])
+
+
+if __name__ == "__main__":
+    main()
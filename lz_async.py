@@ -0,0 +1,221 @@
+import asyncio
+import collections
+import functools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import lz_api
+import lz_frame
+from lz_frame import LZ4FrameDecompressor, LZ4FrameWriter
+
+
+# asyncio adapters: compression and decompression run in an executor so the
+# event loop stays responsive. executor=None is the loop's default thread
+# pool. A ProcessPoolExecutor takes the work off the interpreter entirely, it
+# is used for whole buffers and independent frame blocks. Linked blocks and
+# decompressing readers carry state from one piece to the next and need a
+# thread executor.
+
+READ_SIZE = 64 * 1024 # bytes read from the stream at a time
+HASH_PIECE = 4 * 1024 # bytes of content hashed on the loop between awaits
+
+
+def check_executor(executor, what):
+    if isinstance(executor, ProcessPoolExecutor):
+        raise ValueError('%s keep state between calls, they need a thread executor' % what)
+
+
+async def compress_async(data, level=lz_api.DEFAULT_LEVEL, executor=None, dict=None):
+    # lz_api.compress in the executor
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(lz_api.compress, data, level, dict=dict))
+
+
+async def decompress_async(code, size=None, executor=None, dict=None):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(lz_api.decompress, code, size, dict=dict))
+
+
+class LZ4AsyncFrameWriter(LZ4FrameWriter):
+    # writes an LZ4 frame to an asyncio.StreamWriter. Blocks are compressed
+    # and checksummed in the executor, several at a time for independent
+    # blocks, and written in order. write() waits while too many blocks are pending or the stream
+    # asks to drain, which is the backpressure on the producer. close()
+    # finishes the frame, the stream stays open.
+
+    PENDING_PER_WORKER = 2
+
+    def __init__(self, writer, executor=None, workers=None, **kwargs):
+        super().__init__(writer, **kwargs)
+        if self.block_linked:
+            check_executor(executor, 'Linked blocks')
+        self.executor = executor
+        self.pending = collections.deque()
+        if self.block_linked:
+            # every block starts from the stream context the previous one left
+            self.max_pending = 0
+        else:
+            workers = workers or getattr(executor, '_max_workers', None) or os.cpu_count() or 1
+            self.max_pending = workers * LZ4AsyncFrameWriter.PENDING_PER_WORKER
+
+    def write_block(self, block):
+        # the executor returns the block as written to the frame, checksum
+        # included
+        loop = asyncio.get_running_loop()
+        if self.block_linked:
+            future = loop.run_in_executor(self.executor, self.encode_linked, block)
+        else:
+            future = loop.run_in_executor(self.executor, lz_frame.encode_block, block, self.level,
+                                          self.block_checksum)
+        self.pending.append(future)
+
+    def encode_linked(self, block):
+        return lz_frame.frame_block(block, self.stream.compress_continue(block), self.block_checksum)
+
+    async def emit_pending(self, keep):
+        # writes the finished blocks in order, waits until at most keep are left
+        try:
+            while len(self.pending) > keep or (self.pending and self.pending[0].done()):
+                future = self.pending.popleft()
+                self.fd.write(await future)
+                await self.fd.drain()
+        except BaseException:
+            await self.abort_pending()
+            raise
+
+    async def abort_pending(self):
+        # the frame can't go on after a failed block or write: the blocks not
+        # started are cancelled and the running ones waited for, so none of
+        # their results or errors is left behind
+        futures = list(self.pending)
+        self.pending.clear()
+        for future in futures:
+            future.cancel()
+        await asyncio.gather(*futures, return_exceptions=True)
+
+    async def write(self, data):
+        # one block at a time, so linked blocks are compressed one after
+        # another. The content hash has to see the data in order, it is fed
+        # HASH_PIECE bytes at a time with the loop free in between
+        self.start_write()
+        view = memoryview(data)
+        for pos in range(0, len(view), self.block_size):
+            block = view[pos:pos + self.block_size]
+            if self.hasher is not None:
+                for piece in range(0, len(block), HASH_PIECE):
+                    self.hasher.update(block[piece:piece + HASH_PIECE])
+                    await asyncio.sleep(0)
+            self.append(block)
+            await self.emit_pending(self.max_pending)
+        return len(data)
+
+    async def close(self):
+        if self.closed:
+            return
+        if not self.header_written:
+            self.write_header()
+        if self.buffer:
+            self.write_block(bytes(self.buffer))
+            self.buffer = bytearray()
+        await self.emit_pending(0)
+        super().close()
+        await self.fd.drain()
+
+
+class LZ4AsyncFrameReader:
+    # decodes the LZ4 frames read from an asyncio.StreamReader, the push
+    # decompressor runs in the executor. Data is only read from the stream
+    # as it is asked for, so a slow consumer slows the producer down.
+
+    def __init__(self, reader, executor=None, read_size=READ_SIZE):
+        check_executor(executor, 'Decompressing readers')
+        self.reader = reader
+        self.executor = executor
+        self.read_size = read_size
+        self.decompressor = LZ4FrameDecompressor()
+        self.eof = False
+
+    async def read_chunk(self):
+        # the next decoded bytes, b'' once the stream ends
+        loop = asyncio.get_running_loop()
+        while not self.eof:
+            code = await self.reader.read(self.read_size)
+            if not code:
+                self.eof = True
+                self.decompressor.close()
+                break
+            data = await loop.run_in_executor(self.executor, self.decompressor.feed, code)
+            if data:
+                return data
+        return b''
+
+    async def read(self):
+        # everything up to the end of the stream
+        chunks = []
+        while True:
+            data = await self.read_chunk()
+            if not data:
+                return b''.join(chunks)
+            chunks.append(data)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        data = await self.read_chunk()
+        if not data:
+            raise StopAsyncIteration
+        return data
+
+
+async def measure(file, level, processes):
+    # compresses the file while a ticker measures how late the loop wakes up
+    with open(file, 'rb') as fd:
+        data = fd.read()
+    lags = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            begin = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - begin - 0.001)
+
+    executor = ProcessPoolExecutor() if processes else None
+    task = asyncio.create_task(ticker())
+    begin = time.perf_counter()
+    code = await compress_async(data, level, executor=executor)
+    elapsed = time.perf_counter() - begin
+    done.set()
+    await task
+    if executor is not None:
+        executor.shutdown()
+    if bytes(await decompress_async(code, len(data))) != data:
+        raise RuntimeError('Compressed data does not roundtrip')
+    print('Ratio:', len(data) / len(code))
+    print('Time:', elapsed)
+    print('Loop lag max: %.1f ms, mean: %.1f ms' % (max(lags) * 1000, sum(lags) / len(lags) * 1000))
+
+
+def main():
+    # usage: lz_async.py file [-1 .. -12] [--processes]
+    if len(sys.argv) < 2:
+        print('Not enough arguments provided')
+        return
+    level = lz_api.DEFAULT_LEVEL
+    processes = False
+    for arg in sys.argv[2:]:
+        if arg == '--processes':
+            processes = True
+        elif arg.startswith('-') and arg[1:].isdigit():
+            level = int(arg[1:])
+        else:
+            print('Unknown option', arg)
+            return
+    asyncio.run(measure(sys.argv[1], level, processes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+import mmap
+import os
+import struct
+from array import array
+
+
+# Helpers shared by every compressor variant.
+
+DICTIONARY_SIZE = 1 << 16 # only the end of a dictionary is in reach of matches
+
+
+def as_buffer(text, in_place=False):
+    # compressors accept any buffer (bytes, bytearray, memoryview, mmap). Match
+    # keys are built by slicing text, so it has to slice into hashable bytes:
+    # bytes and mmap do and are used in place, anything else is copied once.
+    # Compressors reading their keys with struct only compare slices, they
+    # pass in_place to use a bytearray (lz_stream's window) without the copy.
+    # Literals are emitted through the returned view without extra copies.
+    if not isinstance(text, (bytes, mmap.mmap)) and not (in_place and isinstance(text, bytearray)):
+        text = bytes(text)
+    return text, memoryview(text)
+
+
+def with_dictionary(dictionary, text):
+    # dictionary followed by text in one buffer, and where text starts
+    dictionary = memoryview(dictionary)[-DICTIONARY_SIZE:]
+    return b''.join((dictionary, text)), len(dictionary)
+
+
+def map_file(fd):
+    # maps a whole file read only instead of reading it into memory, empty
+    # files can't be mapped
+    if os.fstat(fd.fileno()).st_size == 0:
+        return b''
+    return mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+# Match extension shared by every compressor: the common prefix of two
+# positions is measured 8 bytes at a time, XOR of the little endian words
+# gives the first differing byte. Long matches switch to comparing slices of
+# doubling size and then binary search the slice holding the mismatch, so
+# they take a logarithmic number of interpreter steps.
+
+WORD_SIZE = 8
+SLICE_SIZE = 64 # first slice compared for long matches
+read_word = struct.Struct('<Q').unpack_from
+
+
+def match_length(text, match, position, limit):
+    # length of the common prefix of text[match:] and text[position:] that
+    # ends before limit (position + length <= limit). match < position, the
+    # two may overlap
+    begin = position
+    if position + 2 * WORD_SIZE <= limit:
+        # most matches are short, they end in one of the first two words
+        difference = read_word(text, match)[0] ^ read_word(text, position)[0]
+        if difference:
+            return ((difference & -difference).bit_length() - 1) >> 3
+        difference = read_word(text, match + WORD_SIZE)[0] ^ read_word(text, position + WORD_SIZE)[0]
+        if difference:
+            return WORD_SIZE + (((difference & -difference).bit_length() - 1) >> 3)
+        match += 2 * WORD_SIZE
+        position += 2 * WORD_SIZE
+        size = SLICE_SIZE
+        while position + size <= limit and text[match:match + size] == text[position:position + size]:
+            match += size
+            position += size
+            size <<= 1
+        # the mismatch (or limit) is within the next size bytes
+        size = min(size, limit - position)
+        while size > WORD_SIZE:
+            half = size >> 1
+            if text[match:match + half] == text[position:position + half]:
+                match += half
+                position += half
+                size -= half
+            else:
+                size = half
+    while position + WORD_SIZE <= limit:
+        difference = read_word(text, match)[0] ^ read_word(text, position)[0]
+        if difference:
+            return position - begin + (((difference & -difference).bit_length() - 1) >> 3)
+        match += WORD_SIZE
+        position += WORD_SIZE
+    while position < limit and text[match] == text[position]:
+        match += 1
+        position += 1
+    return position - begin
+
+
+# Fixed size match tables for the greedy compressors: the key at every position
+# is read as a little endian integer and hashed by a multiplicative (Fibonacci)
+# hash into a table of 2 ** hash_log positions.
+
+HASH_LOG = 16
+PRIME32 = 2654435761
+PRIME64 = 0x9E3779B97F4A7C15
+KEY_READERS = {
+    4: struct.Struct('<I').unpack_from,
+    8: struct.Struct('<Q').unpack_from,
+}
+
+
+def hash_params(key_length, hash_log=HASH_LOG):
+    # returns (prime, mask, shift), the hash is ((key * prime) & mask) >> shift
+    bits = key_length * 8
+    return (PRIME32 if bits == 32 else PRIME64), (1 << bits) - 1, bits - hash_log
+
+
+def hash_table(hash_log, length):
+    # zeroed table of positions, entries are always checked against the key
+    # so the initial zeros need no special case
+    return array('I' if length <= 0xFFFFFFFF else 'Q', [0]) * (1 << hash_log)
+
+
+# match finders the lazy and optimal compressors can be built with
+HASH_CHAIN = 'chain'
+SUFFIX_ARRAY = 'suffix'
+BINARY_TREE = 'tree'
+
+
+class HashChainTable:
+    # LZ4 HC style hash chains for 4 byte keys over two flat arrays: head keeps
+    # the newest position of every hash and prev links a position to the
+    # previous one with the same hash, indexed modulo the 64 KB window. Walks
+    # stop once a link falls out of the window, older slots have been reused.
+    # Positions must be added in increasing order.
+
+    WINDOW_SIZE = 1 << 16
+    WINDOW_MASK = WINDOW_SIZE - 1
+    EMPTY = -WINDOW_SIZE # never within the window of a real position
+
+    def __init__(self, length, hash_log=HASH_LOG):
+        typecode = 'i' if length < 1 << 31 else 'q'
+        self.head = array(typecode, [HashChainTable.EMPTY]) * (1 << hash_log)
+        self.prev = array(typecode, [HashChainTable.EMPTY]) * HashChainTable.WINDOW_SIZE
+        self.shift = 32 - hash_log
+
+    def copy(self):
+        table = HashChainTable.__new__(HashChainTable)
+        table.head = self.head[:]
+        table.prev = self.prev[:]
+        table.shift = self.shift
+        return table
+
+    def hash(self, key):
+        return ((key * PRIME32) & 0xFFFFFFFF) >> self.shift
+
+    def add(self, key, index):
+        h = ((key * PRIME32) & 0xFFFFFFFF) >> self.shift
+        self.prev[index & HashChainTable.WINDOW_MASK] = self.head[h]
+        self.head[h] = index
+
+
+class BinaryTreeTable:
+    # LZMA/zstd style binary tree match finder. Every hash of a 4 byte key
+    # roots a tree of the window positions with that hash, sorted by their
+    # suffixes. Inserting a position walks down from the root, splitting the
+    # tree around the new suffix (which becomes the root), and meets the
+    # longest matches on the way: find returns every match longer than the
+    # previous one as (length, offset), so the last one is the best.
+    #
+    # Positions are inserted in increasing order, add and find catch up on
+    # the ones skipped since the last call. Comparisons stop at nice_length,
+    # only the best match is extended past it. Positions too close to limit
+    # for a key wait until the text grows (text and limit may be replaced by
+    # longer ones starting the same).
+
+    WINDOW_SIZE = HashChainTable.WINDOW_SIZE
+    WINDOW_MASK = HashChainTable.WINDOW_MASK
+    EMPTY = HashChainTable.EMPTY
+    MAX_OFFSET = WINDOW_SIZE - 1
+    MIN_MATCH = 4
+
+    def __init__(self, text, limit, depth, nice_length, first=0, hash_log=HASH_LOG):
+        # limit: matches end before it. first: first position to insert
+        typecode = 'i' if len(text) < 1 << 31 else 'q'
+        self.text = text
+        self.limit = limit
+        self.depth = depth
+        self.nice_length = nice_length
+        self.next = first
+        self.head = array(typecode, [BinaryTreeTable.EMPTY]) * (1 << hash_log)
+        # children of the position p at 2 * (p % WINDOW_SIZE) (smaller suffixes)
+        # and 2 * (p % WINDOW_SIZE) + 1 (bigger suffixes)
+        self.children = array(typecode, [BinaryTreeTable.EMPTY]) * (2 * BinaryTreeTable.WINDOW_SIZE)
+        self.shift = 32 - hash_log
+
+    def copy(self):
+        table = BinaryTreeTable.__new__(BinaryTreeTable)
+        table.__dict__.update(self.__dict__)
+        table.head = self.head[:]
+        table.children = self.children[:]
+        return table
+
+    def add(self, key, index):
+        # makes sure index is in the tree, the key is read from the text
+        end = min(index + 1, self.limit - BinaryTreeTable.MIN_MATCH + 1)
+        while self.next < end:
+            self.insert(self.next, None)
+
+    def find(self, index):
+        while self.next < index:
+            self.insert(self.next, None)
+        matches = []
+        self.insert(index, matches)
+        if matches:
+            length, offset = matches[-1]
+            if length == self.nice_length:
+                length += match_length(self.text, index + length - offset, index + length, self.limit)
+                matches[-1] = (length, offset)
+        return matches
+
+    def insert(self, index, matches):
+        text = self.text
+        length_limit = min(self.limit - index, self.nice_length)
+        if length_limit < BinaryTreeTable.MIN_MATCH:
+            return
+        self.next = index + 1
+        h = ((KEY_READERS[4](text, index)[0] * PRIME32) & 0xFFFFFFFF) >> self.shift
+        candidate = self.head[h]
+        self.head[h] = index
+        children = self.children
+        mask = BinaryTreeTable.WINDOW_MASK
+        # slots still waiting for the next smaller and bigger subtrees
+        smaller = (index & mask) << 1
+        bigger = smaller + 1
+        smaller_length = bigger_length = 0
+        best = BinaryTreeTable.MIN_MATCH - 1
+        depth = self.depth
+        while depth and index - candidate <= BinaryTreeTable.MAX_OFFSET:
+            depth -= 1
+            pair = (candidate & mask) << 1
+            # both subtree bounds share this prefix with the new suffix
+            length = min(smaller_length, bigger_length)
+            if text[candidate + length] == text[index + length]:
+                length += 1 + match_length(text, candidate + length + 1, index + length + 1,
+                                           index + length_limit)
+                if length > best:
+                    best = length
+                    if matches is not None:
+                        matches.append((length, index - candidate))
+                if length == self.nice_length:
+                    # same suffix as far as we look, it takes the candidate's place
+                    children[smaller] = children[pair]
+                    children[bigger] = children[pair + 1]
+                    return
+                if length == length_limit:
+                    # equal up to the limit, the order is unknown until the
+                    # text grows. Dropping the rest keeps the tree consistent
+                    break
+            if text[candidate + length] < text[index + length]:
+                children[smaller] = candidate
+                smaller = pair + 1
+                candidate = children[smaller]
+                smaller_length = length
+            else:
+                children[bigger] = candidate
+                bigger = pair
+                candidate = children[bigger]
+                bigger_length = length
+        children[smaller] = children[bigger] = BinaryTreeTable.EMPTY
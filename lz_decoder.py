@@ -0,0 +1,205 @@
+# Block decoder shared by every compressor variant.
+#
+# All the state lives in locals of a single loop. When the decoded size is
+# known the output is allocated once and filled in place, otherwise it grows
+# by whole literal runs and matches. Overlapping matches (offset < length) are
+# a repeated pattern, they are copied by doubling the already copied span
+# instead of byte by byte, so a run of n bytes takes log(n) slice copies.
+
+MIN_MATCH_LENGTH = 4
+
+
+def decompress(code, size=None, prefix=b''):
+    # size is the decoded size if known, prefix the history that matches may
+    # refer to (previous block or dictionary), it is not part of the result
+    code_length = len(code)
+    start = len(prefix)
+    if size is None:
+        out = bytearray(prefix)
+        op = None
+    else:
+        out = bytearray(start + size)
+        out[:start] = prefix
+        op = start
+    iterator = 0
+    try:
+        while iterator < code_length:
+            token = code[iterator]
+            iterator += 1
+            # literals
+            length = token >> 4
+            if length == 15:
+                s = 255
+                while s == 255:
+                    s = code[iterator]
+                    iterator += 1
+                    length += s
+            if length:
+                literal_end = iterator + length
+                if literal_end > code_length:
+                    raise ValueError('Truncated LZ4 block, literals past the end')
+                if op is None:
+                    out += code[iterator:literal_end]
+                else:
+                    if op + length > len(out):
+                        raise ValueError('LZ4 block decodes past the declared size')
+                    out[op:op + length] = code[iterator:literal_end]
+                    op += length
+                iterator = literal_end
+            # the last sequence only has literals
+            if iterator == code_length:
+                break
+            offset = code[iterator] | (code[iterator + 1] << 8)
+            iterator += 2
+            length = token & 0x0F
+            if length == 15:
+                s = 255
+                while s == 255:
+                    s = code[iterator]
+                    iterator += 1
+                    length += s
+            length += MIN_MATCH_LENGTH
+            # matches
+            current = len(out) if op is None else op
+            pos = current - offset
+            if offset == 0 or pos < 0:
+                raise ValueError('Invalid LZ4 match offset %d at output position %d' %
+                                 (offset, current - start))
+            if op is None:
+                if offset >= length:
+                    out += out[pos:pos + length]
+                else:
+                    end = current + length
+                    while current < end:
+                        # out[pos:current] is whole periods of the pattern
+                        count = min(current - pos, end - current)
+                        out += out[pos:pos + count]
+                        current += count
+            else:
+                end = op + length
+                if end > len(out):
+                    raise ValueError('LZ4 block decodes past the declared size')
+                if offset >= length:
+                    out[op:end] = out[pos:pos + length]
+                else:
+                    while op < end:
+                        count = min(op - pos, end - op)
+                        out[op:op + count] = out[pos:pos + count]
+                        op += count
+                op = end
+    except IndexError:
+        raise ValueError('Truncated LZ4 block') from None
+    if op is not None and op != len(out):
+        raise ValueError('LZ4 block decoded to %d bytes, expected %d' % (op - start, size))
+    if start:
+        del out[:start]
+    return out
+
+
+# Push decoder: the block arrives in pieces of any size, every piece decodes
+# as far as it goes and the state in between is where the sequence was cut:
+#
+#   TOKEN -> [LITERAL_LENGTH] -> LITERALS -> OFFSET -> [MATCH_LENGTH] -> TOKEN
+#
+# Literals are passed on as they arrive and a match as soon as its offset and
+# length are known. Only the last 64 KB of output are kept for matches.
+
+WINDOW_SIZE = 64 * 1024
+
+TOKEN = 0
+LITERAL_LENGTH = 1
+LITERALS = 2
+OFFSET = 3
+MATCH_LENGTH = 4
+
+
+class LZ4BlockDecompressor:
+
+    def __init__(self, prefix=b''):
+        # prefix as in decompress
+        self.window = bytearray(prefix[-WINDOW_SIZE:])
+        self.state = TOKEN
+        self.token = 0
+        self.length = 0
+        self.offset = 0
+        self.offset_bytes = 0 # bytes of the offset already read
+        self.decoded = 0
+
+    def feed(self, chunk):
+        # decodes chunk after the pieces before it, returns the new output
+        window = self.window
+        mark = len(window)
+        state = self.state
+        token = self.token
+        length = self.length
+        offset = self.offset
+        offset_bytes = self.offset_bytes
+        pos = 0
+        end = len(chunk)
+        while pos < end:
+            if state == TOKEN:
+                token = chunk[pos]
+                pos += 1
+                length = token >> 4
+                offset = offset_bytes = 0
+                state = LITERAL_LENGTH if length == 15 else LITERALS if length else OFFSET
+            elif state == LITERALS:
+                count = min(length, end - pos)
+                window += chunk[pos:pos + count]
+                pos += count
+                length -= count
+                if not length:
+                    state = OFFSET
+            elif state == OFFSET:
+                offset |= chunk[pos] << (8 * offset_bytes)
+                pos += 1
+                offset_bytes += 1
+                if offset_bytes == 2:
+                    length = token & 0x0F
+                    if length == 15:
+                        state = MATCH_LENGTH
+                    else:
+                        self.copy_match(offset, length + MIN_MATCH_LENGTH, mark)
+                        state = TOKEN
+            else:
+                s = chunk[pos]
+                pos += 1
+                length += s
+                if s != 255:
+                    if state == LITERAL_LENGTH:
+                        state = LITERALS
+                    else:
+                        self.copy_match(offset, length + MIN_MATCH_LENGTH, mark)
+                        state = TOKEN
+        self.state = state
+        self.token = token
+        self.length = length
+        self.offset = offset
+        self.offset_bytes = offset_bytes
+        out = bytes(window[mark:])
+        self.decoded += len(out)
+        if len(window) > 2 * WINDOW_SIZE:
+            del window[:-WINDOW_SIZE]
+        return out
+
+    def copy_match(self, offset, length, mark):
+        window = self.window
+        current = len(window)
+        start = current - offset
+        if offset == 0 or start < 0:
+            raise ValueError('Invalid LZ4 match offset %d at output position %d' %
+                             (offset, self.decoded + current - mark))
+        if offset >= length:
+            window += window[start:start + length]
+        else:
+            # repeated pattern, doubled as in decompress
+            stop = current + length
+            while current < stop:
+                count = min(current - start, stop - current)
+                window += window[start:start + count]
+                current += count
+
+    def close(self):
+        # the block may only end right after the literals of a sequence
+        if self.state != OFFSET or self.offset_bytes:
+            raise ValueError('Truncated LZ4 block')
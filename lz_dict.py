@@ -0,0 +1,198 @@
+import argparse
+import os
+import random
+import time
+from array import array
+
+import lz_api
+from lz_common import DICTIONARY_SIZE
+
+
+# Dictionary trainer: builds a preset dictionary (see lz_api.compress dict=)
+# out of sample files or records, COVER style. Every d byte substring (dmer)
+# is scored by the number of samples it appears in. The samples are cut in
+# epochs, one per segment the dictionary has room for, and the segment of
+# every epoch covering the most frequent dmers is taken. Dmers already in the
+# dictionary count no more, so segments don't repeat each other. The best
+# segments go last, next to the data.
+#
+#   python lz_dict.py -o logs.dict samples/*.json
+#   python lz_dict.py -o logs.dict --lines -l 1,9 app.log
+
+SEGMENT_SIZE = 1024 # bytes taken at a time
+DMER_SIZE = 8 # substring length the segments are scored by
+HOLDOUT = 0.1 # share of the samples kept out of training to evaluate on
+DEFAULT_SEED = 0
+
+
+def dmer_ids(text, dmer_size):
+    # the dmer at every position of text as a small integer
+    ids = {}
+    return array('I', [ids.setdefault(text[i:i + dmer_size], len(ids))
+                       for i in range(len(text) - dmer_size + 1)]), len(ids)
+
+
+def best_segment(dmers, frequencies, begin, end, segment_size, dmer_size):
+    # (score, start) of the segment within text[begin:end] with the highest
+    # sum of frequencies over its distinct dmers, a sliding window over the
+    # dmers counts how many times each one is in it
+    width = segment_size - dmer_size + 1
+    active = {}
+    score = 0
+    best = (0, begin)
+    for position in range(begin, end - dmer_size + 1):
+        dmer = dmers[position]
+        count = active.get(dmer, 0)
+        if not count:
+            score += frequencies[dmer]
+        active[dmer] = count + 1
+        first = position - width + 1
+        if first > begin:
+            dmer = dmers[first - 1]
+            count = active[dmer] - 1
+            if count:
+                active[dmer] = count
+            else:
+                del active[dmer]
+                score -= frequencies[dmer]
+        if score > best[0]:
+            best = (score, max(first, begin))
+    return best
+
+
+def train(samples, size=DICTIONARY_SIZE, segment_size=SEGMENT_SIZE, dmer_size=DMER_SIZE):
+    # returns a dictionary of at most size bytes for data like the samples
+    # (a list of bytes-like records)
+    if size <= 0 or size > DICTIONARY_SIZE:
+        raise ValueError('Invalid dictionary size %r, expected 1 to %d' % (size, DICTIONARY_SIZE))
+    if segment_size < dmer_size:
+        raise ValueError('Segments of %d bytes are shorter than the %d byte dmers' % (segment_size, dmer_size))
+    text = b''.join(samples)
+    if len(text) <= size:
+        return text
+    dmers, count = dmer_ids(text, dmer_size)
+    # a dmer counts once per sample it appears in
+    frequencies = array('I', [0]) * count
+    begin = 0
+    for sample in samples:
+        end = begin + len(sample)
+        for dmer in set(dmers[begin:max(begin, end - dmer_size + 1)]):
+            frequencies[dmer] += 1
+        begin = end
+    epochs = max(1, min(size // segment_size, len(text) // segment_size))
+    epoch_size = len(text) // epochs
+    segments = []
+    remaining = size
+    while remaining > 0:
+        found = False
+        for epoch in range(epochs):
+            begin = epoch * epoch_size
+            score, start = best_segment(dmers, frequencies, begin, begin + epoch_size, segment_size, dmer_size)
+            if score <= 0:
+                continue
+            segment = text[start:start + min(segment_size, remaining)]
+            for dmer in dmers[start:start + len(segment) - dmer_size + 1]:
+                frequencies[dmer] = 0
+            segments.append((score, segment))
+            found = True
+            remaining -= len(segment)
+            if remaining <= 0:
+                break
+        if not found:
+            break
+    segments.sort(key=lambda scored: scored[0])
+    return b''.join(segment for score, segment in segments)
+
+
+def evaluate(dictionary, samples, level=lz_api.DEFAULT_LEVEL):
+    # compresses every sample on its own with and without the dictionary,
+    # returns {'size', 'plain', 'dict', 'plain_time', 'dict_time'} (sizes and
+    # seconds summed over the samples)
+    result = {'size': sum(len(sample) for sample in samples), 'plain': 0, 'dict': 0,
+              'plain_time': 0.0, 'dict_time': 0.0}
+    for name, preset in (('plain', None), ('dict', dictionary)):
+        lz_api.compress(b'', level, dict=preset) # load the dictionary before timing
+        begin = time.perf_counter()
+        for sample in samples:
+            code = lz_api.compress(sample, level, dict=preset)
+            result[name] += len(code)
+        result[name + '_time'] = time.perf_counter() - begin
+        for sample in samples:
+            if bytes(lz_api.decompress(lz_api.compress(sample, level, dict=preset), dict=preset)) != sample:
+                raise RuntimeError('Level %s does not roundtrip a sample' % level)
+    return result
+
+
+def load_samples(paths, lines=False):
+    # every file is a sample, or every line of every file with lines.
+    # Directories are walked
+    samples = []
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+        else:
+            files = [path]
+        for name in files:
+            with open(name, 'rb') as fd:
+                data = fd.read()
+            if lines:
+                samples += [line for line in data.splitlines(keepends=True) if line.strip()]
+            elif data:
+                samples.append(data)
+    return samples
+
+
+def split_samples(samples, holdout=HOLDOUT, seed=DEFAULT_SEED):
+    # (training, held out) after a seeded shuffle, one sample at least is
+    # held out when there are two or more
+    samples = list(samples)
+    random.Random(seed).shuffle(samples)
+    count = int(len(samples) * holdout)
+    if holdout > 0 and not count and len(samples) > 1:
+        count = 1
+    return samples[count:], samples[:count]
+
+
+def mb_per_s(size, seconds):
+    return size / (1024 * 1024) / seconds if seconds > 0 else float('inf')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train a preset dictionary on sample files')
+    parser.add_argument('files', nargs='+', help='sample files or directories')
+    parser.add_argument('-o', '--output', help='dictionary file to write')
+    parser.add_argument('-s', '--size', type=int, default=DICTIONARY_SIZE, help='dictionary size in bytes')
+    parser.add_argument('--lines', action='store_true', help='every line is a sample')
+    parser.add_argument('--segment', type=int, default=SEGMENT_SIZE, help='bytes taken at a time')
+    parser.add_argument('--dmer', type=int, default=DMER_SIZE, help='substring length segments are scored by')
+    parser.add_argument('--holdout', type=float, default=HOLDOUT,
+                        help='share of the samples evaluated on instead of trained on')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('-l', '--levels', default='1,%d' % lz_api.DEFAULT_LEVEL,
+                        help='comma separated levels to evaluate with')
+    args = parser.parse_args()
+
+    samples = load_samples(args.files, lines=args.lines)
+    if not samples:
+        print('No samples found')
+        return
+    training, held_out = split_samples(samples, args.holdout, args.seed)
+    begin = time.perf_counter()
+    dictionary = train(training, args.size, args.segment, args.dmer)
+    print('Trained a %d byte dictionary on %d samples in %.2fs' %
+          (len(dictionary), len(training), time.perf_counter() - begin))
+    if args.output:
+        with open(args.output, 'wb') as out:
+            out.write(dictionary)
+    if not held_out:
+        return
+    print('Evaluating on %d held out samples' % len(held_out))
+    for level in args.levels.split(','):
+        result = evaluate(dictionary, held_out, int(level))
+        print('level %-4s ratio %6.3f -> %6.3f  comp %8.3f -> %8.3f MB/s' % (
+            level, result['size'] / result['plain'], result['size'] / result['dict'],
+            mb_per_s(result['size'], result['plain_time']), mb_per_s(result['size'], result['dict_time'])))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import builtins
+import io
+import os
+import sys
+
+import lz_api
+from lz_frame import LZ4Frame, LZ4FrameReader, LZ4FrameWriter
+
+
+# File object interface to LZ4 frames, in the spirit of gzip.GzipFile and
+# bz2.BZ2File. Data is compressed and decompressed one frame block at a time,
+# so at most one block is buffered on each side.
+
+READ_MODE = 'r'
+WRITE_MODE = 'w'
+
+
+class LZ4File(io.BufferedIOBase):
+
+    def __init__(self, filename, mode='r', block_size=LZ4Frame.DEFAULT_BLOCK_SIZE,
+                 block_linked=False, block_checksum=False, content_checksum=True,
+                 level=lz_api.DEFAULT_LEVEL):
+        self.fd = None
+        self.own_fd = False
+        mode = mode.replace('b', '')
+        if mode == 'r':
+            self.mode = READ_MODE
+        elif mode in ('w', 'x', 'a'):
+            # appending writes a new frame, readers decode concatenated frames
+            self.mode = WRITE_MODE
+        else:
+            raise ValueError('Invalid mode: %r' % mode)
+
+        if isinstance(filename, (str, bytes, os.PathLike)):
+            self.fd = builtins.open(filename, mode + 'b')
+            self.own_fd = True
+            self.name = os.fspath(filename)
+        elif hasattr(filename, 'read') or hasattr(filename, 'write'):
+            self.fd = filename
+            self.name = getattr(filename, 'name', '')
+        else:
+            raise TypeError('filename must be a str, bytes, file or PathLike object')
+
+        if self.mode == READ_MODE:
+            self.blocks = LZ4FrameReader(self.fd).blocks()
+            self.block = b''
+            self.block_pos = 0
+            self.eof = False
+        else:
+            self.writer = LZ4FrameWriter(self.fd, block_size=block_size, block_linked=block_linked,
+                                         block_checksum=block_checksum,
+                                         content_checksum=content_checksum, level=level)
+        self.pos = 0
+
+    @property
+    def closed(self):
+        return self.fd is None
+
+    def close(self):
+        if self.fd is None:
+            return
+        try:
+            if self.mode == WRITE_MODE:
+                self.writer.close()
+            else:
+                self.blocks.close()
+                self.block = b''
+        finally:
+            try:
+                if self.own_fd:
+                    self.fd.close()
+            finally:
+                self.fd = None
+
+    def fileno(self):
+        self.check_not_closed()
+        return self.fd.fileno()
+
+    def readable(self):
+        self.check_not_closed()
+        return self.mode == READ_MODE
+
+    def writable(self):
+        self.check_not_closed()
+        return self.mode == WRITE_MODE
+
+    def seekable(self):
+        return False
+
+    def tell(self):
+        self.check_not_closed()
+        return self.pos
+
+    def check_not_closed(self):
+        if self.closed:
+            raise ValueError('I/O operation on closed file')
+
+    def check_mode(self, mode):
+        self.check_not_closed()
+        if self.mode != mode:
+            raise io.UnsupportedOperation('File not open for %s' %
+                                          ('reading' if mode == READ_MODE else 'writing'))
+
+    # READING
+
+    def fill_block(self):
+        # loads the next decoded block, returns False at the end of the file
+        while self.block_pos >= len(self.block):
+            if self.eof:
+                return False
+            block = next(self.blocks, None)
+            if block is None:
+                self.eof = True
+                self.block = b''
+                self.block_pos = 0
+                return False
+            self.block = block
+            self.block_pos = 0
+        return True
+
+    def read1(self, size=-1):
+        self.check_mode(READ_MODE)
+        if size == 0 or not self.fill_block():
+            return b''
+        if size < 0:
+            size = len(self.block) - self.block_pos
+        data = bytes(self.block[self.block_pos:self.block_pos + size])
+        self.block_pos += len(data)
+        self.pos += len(data)
+        return data
+
+    def read(self, size=-1):
+        self.check_mode(READ_MODE)
+        if size is None or size < 0:
+            chunks = []
+            while True:
+                chunk = self.read1()
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            return b''.join(chunks)
+        chunks = []
+        while size > 0:
+            chunk = self.read1(size)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    def readinto(self, buffer):
+        self.check_mode(READ_MODE)
+        with memoryview(buffer) as view, view.cast('B') as target:
+            filled = 0
+            while filled < len(target) and self.fill_block():
+                count = min(len(target) - filled, len(self.block) - self.block_pos)
+                target[filled:filled + count] = self.block[self.block_pos:self.block_pos + count]
+                self.block_pos += count
+                filled += count
+            self.pos += filled
+            return filled
+
+    def readinto1(self, buffer):
+        self.check_mode(READ_MODE)
+        with memoryview(buffer) as view, view.cast('B') as target:
+            if not len(target) or not self.fill_block():
+                return 0
+            count = min(len(target), len(self.block) - self.block_pos)
+            target[:count] = self.block[self.block_pos:self.block_pos + count]
+            self.block_pos += count
+            self.pos += count
+            return count
+
+    def peek(self, size=0):
+        # returns buffered data without advancing, used by readline()
+        self.check_mode(READ_MODE)
+        if not self.fill_block():
+            return b''
+        return bytes(self.block[self.block_pos:])
+
+    # WRITING
+
+    def write(self, data):
+        self.check_mode(WRITE_MODE)
+        if isinstance(data, (bytes, bytearray)):
+            length = len(data)
+        else:
+            data = memoryview(data).cast('B')
+            length = data.nbytes
+        self.writer.write(data)
+        self.pos += length
+        return length
+
+
+def open(filename, mode='rb', block_size=LZ4Frame.DEFAULT_BLOCK_SIZE, block_linked=False,
+         block_checksum=False, content_checksum=True, level=lz_api.DEFAULT_LEVEL,
+         encoding=None, errors=None, newline=None):
+    if 't' in mode:
+        if 'b' in mode:
+            raise ValueError('Invalid mode: %r' % mode)
+    else:
+        if encoding is not None:
+            raise ValueError("Argument 'encoding' not supported in binary mode")
+        if errors is not None:
+            raise ValueError("Argument 'errors' not supported in binary mode")
+        if newline is not None:
+            raise ValueError("Argument 'newline' not supported in binary mode")
+
+    binary_file = LZ4File(filename, mode.replace('t', ''), block_size=block_size,
+                          block_linked=block_linked, block_checksum=block_checksum,
+                          content_checksum=content_checksum, level=level)
+    if 't' in mode:
+        encoding = io.text_encoding(encoding)
+        return io.TextIOWrapper(binary_file, encoding, errors, newline)
+    return binary_file
+
+
+def main():
+    # pipes stdin to stdout: lz_file.py -c|-d < input > output
+    if len(sys.argv) < 2:
+        print('Not enough arguments provided')
+    elif sys.argv[1] == '-c':
+        with LZ4File(sys.stdout.buffer, 'wb') as out:
+            while True:
+                chunk = sys.stdin.buffer.read(LZ4Frame.DEFAULT_BLOCK_SIZE)
+                if not chunk:
+                    break
+                out.write(chunk)
+    elif sys.argv[1] == '-d':
+        with LZ4File(sys.stdin.buffer, 'rb') as fd:
+            while True:
+                chunk = fd.read1()
+                if not chunk:
+                    break
+                sys.stdout.buffer.write(chunk)
+    else:
+        print('Unknown command', sys.argv[1])
+
+
+if __name__ == "__main__":
+    main()
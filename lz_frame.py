@@ -0,0 +1,508 @@
+import io
+import os
+import struct
+import sys
+
+import lz_api
+from lz_decoder import LZ4BlockDecompressor
+from lz_stream import LZ4StreamCompressor
+from xxh32 import XXH32, xxh32
+
+
+# LZ4 frame format (https://github.com/lz4/lz4/blob/dev/doc/lz4_Frame_format.md)
+#
+#   magic | FLG | BD | [content size] | HC | block* | end mark | [checksum]
+#
+# Every block is compressed on its own with lz_api.compress, so memory is bounded
+# by the block max size no matter how big the input is.
+
+class LZ4Frame:
+
+    ENCODE_EXT = '.lz4'
+
+    MAGIC = 0x184D2204
+    SKIPPABLE_MAGIC = 0x184D2A50 # 0x184D2A50 - 0x184D2A5F
+    SKIPPABLE_MASK = 0xFFFFFFF0
+    VERSION = 1
+
+    # block max size id -> size in bytes
+    BLOCK_SIZES = {
+        4: 64 * 1024,
+        5: 256 * 1024,
+        6: 1024 * 1024,
+        7: 4 * 1024 * 1024,
+    }
+    DEFAULT_BLOCK_SIZE = 64 * 1024
+
+    UNCOMPRESSED_FLAG = 0x80000000
+    END_MARK = 0
+    WINDOW_SIZE = 64 * 1024 # history kept between linked blocks
+
+    # FLG bits
+    FLAG_BLOCK_INDEPENDENT = 0x20
+    FLAG_BLOCK_CHECKSUM = 0x10
+    FLAG_CONTENT_SIZE = 0x08
+    FLAG_CONTENT_CHECKSUM = 0x04
+    FLAG_DICT_ID = 0x01
+
+    @staticmethod
+    def block_size_id(block_size):
+        for size_id, size in LZ4Frame.BLOCK_SIZES.items():
+            if size == block_size:
+                return size_id
+        raise ValueError('Invalid block size %d, expected one of %s' %
+                         (block_size, sorted(LZ4Frame.BLOCK_SIZES.values())))
+
+    @staticmethod
+    def read_exact(fd, size):
+        data = fd.read(size)
+        if len(data) != size:
+            raise ValueError('Truncated LZ4 frame')
+        return data
+
+
+def compress_block(block, level=lz_api.DEFAULT_LEVEL):
+    # independent block compression, module level so it can run in a worker.
+    # None means the block is incompressible and is stored as is
+    if lz_api.incompressible(block):
+        return None
+    return lz_api.compressor(level).compress(block)
+
+
+def frame_block(block, code, block_checksum=False):
+    # the block as written to the frame: its size, the data and the checksum
+    # if any. Stored as is if compression did not help
+    if code is None or len(code) >= len(block):
+        code = block
+        size = len(block) | LZ4Frame.UNCOMPRESSED_FLAG
+    else:
+        size = len(code)
+    record = bytearray(struct.pack('<I', size))
+    record += code
+    if block_checksum:
+        record += struct.pack('<I', xxh32(code))
+    return record
+
+
+def encode_block(block, level=lz_api.DEFAULT_LEVEL, block_checksum=False):
+    # compress_block and frame_block in one call, so a worker also does the
+    # checksum
+    return frame_block(block, compress_block(block, level), block_checksum)
+
+
+def decompress_block(code):
+    return lz_api.decompress(code)
+
+
+class LZ4FrameWriter:
+
+    def __init__(self, fd, block_size=LZ4Frame.DEFAULT_BLOCK_SIZE, block_linked=False,
+                 block_checksum=False, content_checksum=True, content_size=None,
+                 level=lz_api.DEFAULT_LEVEL):
+        self.fd = fd
+        self.level = level
+        self.block_size = block_size
+        self.size_id = LZ4Frame.block_size_id(block_size)
+        self.block_linked = block_linked
+        self.block_checksum = block_checksum
+        self.content_checksum = content_checksum
+        self.content_size = content_size
+        self.hasher = XXH32() if content_checksum else None
+        self.buffer = bytearray()
+        # linked blocks are compressed by a streaming context
+        self.stream = LZ4StreamCompressor(level) if block_linked else None
+        self.written = 0
+        self.header_written = False
+        self.closed = False
+
+    def write_header(self):
+        flags = LZ4Frame.VERSION << 6
+        if not self.block_linked:
+            flags |= LZ4Frame.FLAG_BLOCK_INDEPENDENT
+        if self.block_checksum:
+            flags |= LZ4Frame.FLAG_BLOCK_CHECKSUM
+        if self.content_size is not None:
+            flags |= LZ4Frame.FLAG_CONTENT_SIZE
+        if self.content_checksum:
+            flags |= LZ4Frame.FLAG_CONTENT_CHECKSUM
+        descriptor = bytearray([flags, self.size_id << 4])
+        if self.content_size is not None:
+            descriptor += struct.pack('<Q', self.content_size)
+        # header checksum is the second byte of the descriptor hash
+        descriptor.append((xxh32(descriptor) >> 8) & 0xFF)
+        self.fd.write(struct.pack('<I', LZ4Frame.MAGIC))
+        self.fd.write(descriptor)
+        self.header_written = True
+
+    def compress_block(self, block):
+        if self.block_linked:
+            code = self.stream.compress_continue(block)
+        else:
+            code = compress_block(block, self.level)
+        return code
+
+    def write_block(self, block):
+        self.emit_block(block, self.compress_block(block))
+
+    def flush_blocks(self):
+        # hook for writers that compress blocks asynchronously
+        pass
+
+    def emit_block(self, block, code):
+        self.fd.write(frame_block(block, code, self.block_checksum))
+
+    def write(self, data):
+        self.start_write()
+        if self.hasher is not None:
+            self.hasher.update(data)
+        self.append(data)
+        return len(data)
+
+    def start_write(self):
+        if self.closed:
+            raise ValueError('write to closed LZ4 frame')
+        if not self.header_written:
+            self.write_header()
+
+    def append(self, data):
+        # data already hashed
+        self.written += len(data)
+        self.buffer += data
+        # emit every full block, keep the rest buffered
+        while len(self.buffer) >= self.block_size:
+            self.write_block(bytes(self.buffer[:self.block_size]))
+            del self.buffer[:self.block_size]
+
+    def close(self):
+        if self.closed:
+            return
+        if not self.header_written:
+            self.write_header()
+        if self.buffer:
+            self.write_block(bytes(self.buffer))
+            self.buffer = bytearray()
+        self.flush_blocks()
+        if self.content_size is not None and self.content_size != self.written:
+            raise ValueError('Content size mismatch, declared %d but wrote %d' %
+                             (self.content_size, self.written))
+        self.fd.write(struct.pack('<I', LZ4Frame.END_MARK))
+        if self.hasher is not None:
+            self.fd.write(struct.pack('<I', self.hasher.intdigest()))
+        self.closed = True
+
+
+class LZ4FrameReader:
+
+    def __init__(self, fd):
+        self.fd = fd
+
+    def read_header(self):
+        # returns False at the end of the stream, skippable frames are ignored
+        while True:
+            magic = self.fd.read(4)
+            if not magic:
+                return False
+            if len(magic) != 4:
+                raise ValueError('Truncated LZ4 frame')
+            magic = struct.unpack('<I', magic)[0]
+            if magic & LZ4Frame.SKIPPABLE_MASK == LZ4Frame.SKIPPABLE_MAGIC:
+                size = struct.unpack('<I', LZ4Frame.read_exact(self.fd, 4))[0]
+                LZ4Frame.read_exact(self.fd, size)
+                continue
+            if magic != LZ4Frame.MAGIC:
+                raise ValueError('Invalid LZ4 frame magic number 0x%08X' % magic)
+            break
+
+        descriptor = bytearray(LZ4Frame.read_exact(self.fd, 2))
+        flags, bd = descriptor
+        if flags >> 6 != LZ4Frame.VERSION:
+            raise ValueError('Unsupported LZ4 frame version %d' % (flags >> 6))
+        size_id = (bd >> 4) & 0x07
+        if size_id not in LZ4Frame.BLOCK_SIZES:
+            raise ValueError('Invalid block max size id %d' % size_id)
+        self.block_size = LZ4Frame.BLOCK_SIZES[size_id]
+        self.block_linked = not flags & LZ4Frame.FLAG_BLOCK_INDEPENDENT
+        self.block_checksum = bool(flags & LZ4Frame.FLAG_BLOCK_CHECKSUM)
+        self.content_checksum = bool(flags & LZ4Frame.FLAG_CONTENT_CHECKSUM)
+        self.content_size = None
+        if flags & LZ4Frame.FLAG_CONTENT_SIZE:
+            content_size = LZ4Frame.read_exact(self.fd, 8)
+            descriptor += content_size
+            self.content_size = struct.unpack('<Q', content_size)[0]
+        if flags & LZ4Frame.FLAG_DICT_ID:
+            descriptor += LZ4Frame.read_exact(self.fd, 4)
+        checksum = LZ4Frame.read_exact(self.fd, 1)[0]
+        if checksum != (xxh32(descriptor) >> 8) & 0xFF:
+            raise ValueError('Invalid LZ4 frame header checksum')
+        return True
+
+    def read_raw_block(self):
+        # returns (data, uncompressed) or None at the end mark
+        size = struct.unpack('<I', LZ4Frame.read_exact(self.fd, 4))[0]
+        if size == LZ4Frame.END_MARK:
+            return None
+        uncompressed = bool(size & LZ4Frame.UNCOMPRESSED_FLAG)
+        size &= ~LZ4Frame.UNCOMPRESSED_FLAG
+        if size > self.block_size:
+            raise ValueError('Block of %d bytes exceeds the block max size' % size)
+        code = LZ4Frame.read_exact(self.fd, size)
+        if self.block_checksum:
+            checksum = struct.unpack('<I', LZ4Frame.read_exact(self.fd, 4))[0]
+            if checksum != xxh32(code):
+                raise ValueError('Invalid LZ4 block checksum')
+        return code, uncompressed
+
+    def read_block(self, history):
+        # returns the decoded block or None at the end mark
+        raw = self.read_raw_block()
+        if raw is None:
+            return None
+        code, uncompressed = raw
+        if uncompressed:
+            return code
+        return lz_api.decompress(code, prefix=history)
+
+    def read_footer(self, hasher, read):
+        # checks the content checksum and size once the end mark is reached
+        if hasher is not None:
+            checksum = struct.unpack('<I', LZ4Frame.read_exact(self.fd, 4))[0]
+            if checksum != hasher.intdigest():
+                raise ValueError('Invalid LZ4 content checksum')
+        if self.content_size is not None and self.content_size != read:
+            raise ValueError('Content size mismatch, expected %d but got %d' %
+                             (self.content_size, read))
+
+    def frame_blocks(self):
+        # yields the decoded blocks of the current frame
+        hasher = XXH32() if self.content_checksum else None
+        history = b''
+        read = 0
+        while True:
+            block = self.read_block(history)
+            if block is None:
+                break
+            if self.block_linked:
+                history = (history + block)[-LZ4Frame.WINDOW_SIZE:]
+            if hasher is not None:
+                hasher.update(block)
+            read += len(block)
+            yield block
+        self.read_footer(hasher, read)
+
+    def blocks(self):
+        # concatenated frames are decoded one after another
+        while self.read_header():
+            yield from self.frame_blocks()
+
+
+class LZ4FrameDecompressor:
+    # push counterpart of LZ4FrameReader for data that arrives in pieces (e.g.
+    # off a socket): feed(chunk) returns whatever the pieces so far decode
+    # to. Headers and checksums are buffered until complete, block contents
+    # are decoded as they arrive, so only the 64 KB window of linked frames
+    # and the pieces of a header are kept.
+
+    HEADER = 0 # magic number and frame descriptor
+    SKIP = 1 # contents of a skippable frame
+    BLOCK_SIZE = 2
+    BLOCK = 3
+    BLOCK_CHECKSUM = 4
+    CONTENT_CHECKSUM = 5
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.state = LZ4FrameDecompressor.HEADER
+        self.frame = None # reader holding the current frame's header
+        self.remaining = 0 # bytes left of the block or skippable frame
+        self.history = b''
+        self.decoder = None # of the current block, None if stored
+        self.block_hasher = None
+        self.hasher = None
+        self.read = 0
+
+    @staticmethod
+    def header_size(buffer, pos):
+        # size of the header starting at pos, None until enough of it is there
+        if len(buffer) - pos < 4:
+            return None
+        magic = struct.unpack_from('<I', buffer, pos)[0]
+        if magic & LZ4Frame.SKIPPABLE_MASK == LZ4Frame.SKIPPABLE_MAGIC:
+            return 8
+        if len(buffer) - pos < 5:
+            return None
+        flags = buffer[pos + 4]
+        size = 4 + 2 + 1
+        if flags & LZ4Frame.FLAG_CONTENT_SIZE:
+            size += 8
+        if flags & LZ4Frame.FLAG_DICT_ID:
+            size += 4
+        return size
+
+    def feed(self, chunk):
+        buffer = self.buffer
+        buffer += chunk
+        out = []
+        pos = 0
+        while pos < len(buffer):
+            available = len(buffer) - pos
+            state = self.state
+            if state == LZ4FrameDecompressor.HEADER:
+                size = LZ4FrameDecompressor.header_size(buffer, pos)
+                if size is None or available < size:
+                    break
+                magic = struct.unpack_from('<I', buffer, pos)[0]
+                if magic & LZ4Frame.SKIPPABLE_MASK == LZ4Frame.SKIPPABLE_MAGIC:
+                    self.remaining = struct.unpack_from('<I', buffer, pos + 4)[0]
+                    self.state = LZ4FrameDecompressor.SKIP
+                else:
+                    # the header is checked by the pull reader
+                    self.frame = LZ4FrameReader(io.BytesIO(bytes(buffer[pos:pos + size])))
+                    self.frame.read_header()
+                    self.hasher = XXH32() if self.frame.content_checksum else None
+                    self.history = b''
+                    self.read = 0
+                    self.state = LZ4FrameDecompressor.BLOCK_SIZE
+                pos += size
+            elif state == LZ4FrameDecompressor.SKIP:
+                count = min(self.remaining, available)
+                pos += count
+                self.remaining -= count
+                if not self.remaining:
+                    self.state = LZ4FrameDecompressor.HEADER
+            elif state == LZ4FrameDecompressor.BLOCK:
+                count = min(self.remaining, available)
+                piece = bytes(buffer[pos:pos + count])
+                pos += count
+                self.remaining -= count
+                if self.block_hasher is not None:
+                    self.block_hasher.update(piece)
+                if self.decoder is None:
+                    block = piece
+                    if self.frame.block_linked:
+                        self.history = (self.history + piece)[-LZ4Frame.WINDOW_SIZE:]
+                else:
+                    block = self.decoder.feed(piece)
+                if self.hasher is not None:
+                    self.hasher.update(block)
+                self.read += len(block)
+                out.append(block)
+                if not self.remaining:
+                    if self.decoder is not None:
+                        self.decoder.close()
+                        if self.frame.block_linked:
+                            self.history = bytes(self.decoder.window[-LZ4Frame.WINDOW_SIZE:])
+                    if self.frame.block_checksum:
+                        self.state = LZ4FrameDecompressor.BLOCK_CHECKSUM
+                    else:
+                        self.state = LZ4FrameDecompressor.BLOCK_SIZE
+            else:
+                # fields of 4 bytes
+                if available < 4:
+                    break
+                value = struct.unpack_from('<I', buffer, pos)[0]
+                pos += 4
+                if state == LZ4FrameDecompressor.BLOCK_CHECKSUM:
+                    if value != self.block_hasher.intdigest():
+                        raise ValueError('Invalid LZ4 block checksum')
+                    self.state = LZ4FrameDecompressor.BLOCK_SIZE
+                elif state == LZ4FrameDecompressor.CONTENT_CHECKSUM:
+                    if value != self.hasher.intdigest():
+                        raise ValueError('Invalid LZ4 content checksum')
+                    self.end_frame()
+                elif value == LZ4Frame.END_MARK:
+                    if self.hasher is not None:
+                        self.state = LZ4FrameDecompressor.CONTENT_CHECKSUM
+                    else:
+                        self.end_frame()
+                else:
+                    uncompressed = bool(value & LZ4Frame.UNCOMPRESSED_FLAG)
+                    value &= ~LZ4Frame.UNCOMPRESSED_FLAG
+                    if value > self.frame.block_size:
+                        raise ValueError('Block of %d bytes exceeds the block max size' % value)
+                    self.remaining = value
+                    self.decoder = None
+                    if not uncompressed:
+                        self.decoder = LZ4BlockDecompressor(self.history if self.frame.block_linked else b'')
+                    self.block_hasher = XXH32() if self.frame.block_checksum else None
+                    self.state = LZ4FrameDecompressor.BLOCK
+        del buffer[:pos]
+        return b''.join(out)
+
+    def end_frame(self):
+        if self.frame.content_size is not None and self.frame.content_size != self.read:
+            raise ValueError('Content size mismatch, expected %d but got %d' %
+                             (self.frame.content_size, self.read))
+        self.state = LZ4FrameDecompressor.HEADER
+
+    def close(self):
+        # the data may only end between frames
+        if self.state != LZ4FrameDecompressor.HEADER or self.buffer:
+            raise ValueError('Truncated LZ4 frame')
+
+
+def compress_stream(source, dest, chunk_size=LZ4Frame.DEFAULT_BLOCK_SIZE, **kwargs):
+    writer = LZ4FrameWriter(dest, **kwargs)
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        writer.write(chunk)
+    writer.close()
+
+
+def decompress_stream(source, dest):
+    for block in LZ4FrameReader(source).blocks():
+        dest.write(block)
+
+
+def compress(data, **kwargs):
+    dest = io.BytesIO()
+    writer = LZ4FrameWriter(dest, **kwargs)
+    writer.write(data)
+    writer.close()
+    return dest.getvalue()
+
+
+def decompress(code):
+    return b''.join(LZ4FrameReader(io.BytesIO(code)).blocks())
+
+
+def main():
+    # usage: lz_frame.py -c|-d file [-1 .. -12] [-B4|-B5|-B6|-B7] [-BD] [-BX] [--no-frame-crc]
+    if len(sys.argv) < 3:
+        print('Not enough arguments provided')
+        return
+    options = {}
+    for arg in sys.argv[3:]:
+        if arg == '-BD':
+            options['block_linked'] = True
+        elif arg == '-BX':
+            options['block_checksum'] = True
+        elif arg == '--no-frame-crc':
+            options['content_checksum'] = False
+        elif arg.startswith('-B') and arg[2:].isdigit():
+            options['block_size'] = LZ4Frame.BLOCK_SIZES.get(int(arg[2:]), 0)
+        elif arg.startswith('-') and arg[1:].isdigit():
+            options['level'] = int(arg[1:])
+        else:
+            print('Unknown option', arg)
+            return
+    if sys.argv[1] == '-c':
+        file = sys.argv[2]
+        print('Compressing file', file)
+        options['content_size'] = os.path.getsize(file)
+        options.setdefault('block_size', LZ4Frame.DEFAULT_BLOCK_SIZE)
+        with open(file, 'rb') as fd, open(file + LZ4Frame.ENCODE_EXT, 'wb') as out:
+            compress_stream(fd, out, chunk_size=options['block_size'], **options)
+        print('Ratio:', options['content_size'] / os.path.getsize(file + LZ4Frame.ENCODE_EXT))
+    elif sys.argv[1] == '-d':
+        file = sys.argv[2]
+        print('Decompressing file', file)
+        with open(file, 'rb') as fd, open(".".join(file.split('.')[:-1]), 'wb') as out:
+            decompress_stream(fd, out)
+    else:
+        print('Unknown command', sys.argv[1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import collections
+import io
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import lz_frame
+from lz_frame import LZ4Frame, LZ4FrameReader, LZ4FrameWriter
+from xxh32 import XXH32
+
+
+# Block parallel compression: the input is cut into independent blocks of the
+# frame block size, every block is compressed in a worker process and the
+# results are written back in order. Blocks don't depend on each other so the
+# output is the same for any number of workers. Frames of independent blocks
+# are decompressed the same way, one block per task.
+
+class LZ4ParallelFrameWriter(LZ4FrameWriter):
+
+    PENDING_PER_WORKER = 2 # blocks in flight per worker, bounds memory
+
+    def __init__(self, fd, workers=None, executor=None, **kwargs):
+        if kwargs.get('block_linked'):
+            raise ValueError('Linked blocks can not be compressed in parallel')
+        super().__init__(fd, **kwargs)
+        self.workers = workers or os.cpu_count() or 1
+        self.own_executor = executor is None
+        self.executor = executor or ProcessPoolExecutor(max_workers=self.workers)
+        self.pending = collections.deque()
+        self.max_pending = self.workers * LZ4ParallelFrameWriter.PENDING_PER_WORKER
+
+    def write_block(self, block):
+        self.pending.append((block, self.executor.submit(lz_frame.compress_block, block, self.level)))
+        # keep the pipeline full but write the oldest blocks as soon as possible
+        while len(self.pending) > self.max_pending or (self.pending and self.pending[0][1].done()):
+            block, future = self.pending.popleft()
+            self.emit_block(block, future.result())
+
+    def flush_blocks(self):
+        while self.pending:
+            block, future = self.pending.popleft()
+            self.emit_block(block, future.result())
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            if self.own_executor:
+                self.executor.shutdown()
+
+
+class LZ4ParallelFrameReader(LZ4FrameReader):
+
+    PENDING_PER_WORKER = 2
+
+    def __init__(self, fd, workers=None, executor=None):
+        super().__init__(fd)
+        self.workers = workers or os.cpu_count() or 1
+        self.own_executor = executor is None
+        self.executor = executor or ProcessPoolExecutor(max_workers=self.workers)
+        self.max_pending = self.workers * LZ4ParallelFrameReader.PENDING_PER_WORKER
+
+    def frame_blocks(self):
+        # linked blocks need the previous block decoded first
+        if self.block_linked:
+            yield from super().frame_blocks()
+            return
+        hasher = XXH32() if self.content_checksum else None
+        pending = collections.deque()
+        read = 0
+        while True:
+            raw = self.read_raw_block()
+            if raw is None:
+                break
+            code, uncompressed = raw
+            # stored blocks don't need a worker
+            pending.append(code if uncompressed else self.executor.submit(lz_frame.decompress_block, code))
+            while len(pending) > self.max_pending:
+                block = LZ4ParallelFrameReader.result(pending.popleft())
+                if hasher is not None:
+                    hasher.update(block)
+                read += len(block)
+                yield block
+        while pending:
+            block = LZ4ParallelFrameReader.result(pending.popleft())
+            if hasher is not None:
+                hasher.update(block)
+            read += len(block)
+            yield block
+        self.read_footer(hasher, read)
+
+    @staticmethod
+    def result(block):
+        if isinstance(block, bytes):
+            return block
+        return block.result()
+
+    def close(self):
+        if self.own_executor:
+            self.executor.shutdown()
+
+
+def compress_stream(source, dest, workers=None, block_size=LZ4Frame.DEFAULT_BLOCK_SIZE, **kwargs):
+    writer = LZ4ParallelFrameWriter(dest, workers=workers, block_size=block_size, **kwargs)
+    while True:
+        chunk = source.read(block_size)
+        if not chunk:
+            break
+        writer.write(chunk)
+    writer.close()
+
+
+def compress(data, workers=None, **kwargs):
+    dest = io.BytesIO()
+    writer = LZ4ParallelFrameWriter(dest, workers=workers, **kwargs)
+    writer.write(data)
+    writer.close()
+    return dest.getvalue()
+
+
+def decompress_stream(source, dest, workers=None):
+    reader = LZ4ParallelFrameReader(source, workers=workers)
+    try:
+        for block in reader.blocks():
+            dest.write(block)
+    finally:
+        reader.close()
+
+
+def decompress(code, workers=None):
+    reader = LZ4ParallelFrameReader(io.BytesIO(code), workers=workers)
+    frames = []
+    try:
+        while reader.read_header():
+            if reader.content_size is None:
+                frames.append(b''.join(reader.frame_blocks()))
+                continue
+            # the content size is known, blocks are copied into their place
+            out = bytearray(reader.content_size)
+            view = memoryview(out)
+            pos = 0
+            for block in reader.frame_blocks():
+                if pos + len(block) > len(out):
+                    raise ValueError('Content size mismatch, frame is bigger than declared')
+                view[pos:pos + len(block)] = block
+                pos += len(block)
+            view.release()
+            frames.append(out)
+    finally:
+        reader.close()
+    if len(frames) == 1:
+        return frames[0]
+    return b''.join(frames)
+
+
+def main():
+    # usage: lz_parallel.py -c|-d file [-jN] [-1 .. -12] [-B4|-B5|-B6|-B7]
+    if len(sys.argv) < 3:
+        print('Not enough arguments provided')
+        return
+    options = {'block_size': LZ4Frame.DEFAULT_BLOCK_SIZE}
+    for arg in sys.argv[3:]:
+        if arg.startswith('-j') and arg[2:].isdigit():
+            options['workers'] = int(arg[2:])
+        elif arg.startswith('-B') and arg[2:].isdigit():
+            options['block_size'] = LZ4Frame.BLOCK_SIZES.get(int(arg[2:]), 0)
+        elif arg.startswith('-') and arg[1:].isdigit():
+            options['level'] = int(arg[1:])
+        else:
+            print('Unknown option', arg)
+            return
+    if sys.argv[1] == '-c':
+        file = sys.argv[2]
+        print('Compressing file', file)
+        options['content_size'] = os.path.getsize(file)
+        with open(file, 'rb') as fd, open(file + LZ4Frame.ENCODE_EXT, 'wb') as out:
+            compress_stream(fd, out, **options)
+        print('Ratio:', options['content_size'] / os.path.getsize(file + LZ4Frame.ENCODE_EXT))
+    elif sys.argv[1] == '-d':
+        file = sys.argv[2]
+        print('Decompressing file', file)
+        with open(file, 'rb') as fd, open(".".join(file.split('.')[:-1]), 'wb') as out:
+            decompress_stream(fd, out, workers=options.get('workers'))
+    else:
+        print('Unknown command', sys.argv[1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import logging
+import time
+
+
+# Progress sinks for the long running compressors (the optimal parser). They
+# are told start(total) with the bytes to compress, update(count) each time a
+# piece is done (a parse window, never a single position) and close() at the
+# end. Progress is the no-op default, so library calls pay one method call
+# per window and nothing is imported for them. tqdm is only needed by the
+# sink drawing a tqdm bar.
+
+
+class Progress:
+
+    def start(self, total):
+        pass
+
+    def update(self, count):
+        pass
+
+    def close(self):
+        pass
+
+
+NO_PROGRESS = Progress()
+
+
+class TqdmProgress(Progress):
+    # a tqdm bar in bytes, keyword arguments go to tqdm. Raises ImportError
+    # without tqdm
+
+    def __init__(self, **kwargs):
+        from tqdm import tqdm
+        self.tqdm = tqdm
+        self.kwargs = kwargs
+        self.bar = None
+
+    def start(self, total):
+        self.bar = self.tqdm(total=total, unit='B', unit_scale=True, **self.kwargs)
+
+    def update(self, count):
+        self.bar.update(count)
+
+    def close(self):
+        if self.bar is not None:
+            self.bar.close()
+            self.bar = None
+
+
+class LoggingProgress(Progress):
+    # logs how far it got at most once per interval seconds, and the
+    # throughput at the end
+
+    def __init__(self, logger=None, level=logging.INFO, interval=1.0):
+        self.logger = logger or logging.getLogger('lz4')
+        self.level = level
+        self.interval = interval
+        self.total = 0
+        self.done = 0
+        self.begin = self.last = 0.0
+
+    def start(self, total):
+        self.total = total
+        self.done = 0
+        self.begin = self.last = time.perf_counter()
+
+    def update(self, count):
+        self.done += count
+        now = time.perf_counter()
+        if now - self.last >= self.interval:
+            self.last = now
+            self.logger.log(self.level, 'Compressed %d of %d bytes (%.0f%%)', self.done, self.total,
+                            100 * self.done / max(self.total, 1))
+
+    def close(self):
+        elapsed = time.perf_counter() - self.begin
+        self.logger.log(self.level, 'Compressed %d bytes in %.2f s (%.0f KB/s)', self.done, elapsed,
+                        self.done / 1024 / max(elapsed, 1e-9))
+
+
+class CallbackProgress(Progress):
+    # calls callback(done, total) on every update, e.g. to feed a metrics
+    # gauge or a GUI
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.total = 0
+        self.done = 0
+
+    def start(self, total):
+        self.total = total
+        self.done = 0
+
+    def update(self, count):
+        self.done += count
+        self.callback(self.done, self.total)
@@ -0,0 +1,213 @@
+import bisect
+import io
+import os
+import struct
+import sys
+from array import array
+
+import lz_api
+from lz_frame import LZ4Frame, LZ4FrameReader, LZ4FrameWriter
+from xxh32 import xxh32
+
+
+# Seekable LZ4 files, in the spirit of the zstd seekable format: one frame of
+# independent blocks followed by a seek table in a skippable frame, so any
+# LZ4 reader still decodes the whole file and ignores the table.
+#
+#   frame | skippable magic | table size | (compressed, decompressed)* | footer
+#
+# Every entry is the size of a block as stored in the frame (size field and
+# checksum included) and its decoded size, as two little endian 32 bit
+# integers. The footer is the number of entries (4 bytes), a descriptor byte
+# (reserved, 0) and SEEKABLE_MAGIC, it ends the file so the table is found
+# by reading backwards. A read only decodes the blocks it overlaps.
+
+SEEK_TABLE_MAGIC = 0x184D2A5E # skippable frame holding the table
+SEEKABLE_MAGIC = 0x8F92EAB1
+FOOTER = struct.Struct('<IBI')
+ENTRY = struct.Struct('<II')
+
+
+class LZ4SeekableWriter(LZ4FrameWriter):
+
+    def __init__(self, fd, **kwargs):
+        if kwargs.get('block_linked'):
+            raise ValueError('Linked blocks can not be decoded on their own, seekable files need independent blocks')
+        super().__init__(fd, **kwargs)
+        self.entries = []
+
+    def emit_block(self, block, code):
+        super().emit_block(block, code)
+        # the same choice emit_block made between the code and the block
+        stored = len(block) if code is None or len(code) >= len(block) else len(code)
+        self.entries.append((4 + stored + (4 if self.block_checksum else 0), len(block)))
+
+    def close(self):
+        if self.closed:
+            return
+        super().close()
+        table = bytearray()
+        for entry in self.entries:
+            table += ENTRY.pack(*entry)
+        table += FOOTER.pack(len(self.entries), 0, SEEKABLE_MAGIC)
+        self.fd.write(struct.pack('<II', SEEK_TABLE_MAGIC, len(table)))
+        self.fd.write(table)
+
+
+class LZ4SeekableReader(io.BufferedIOBase):
+    # random access to a seekable file: read, seek and pread(offset, length)
+    # locate the blocks by binary search over their decoded offsets. The
+    # last decoded block is kept for reads that continue in it.
+
+    def __init__(self, fd):
+        self.fd = fd
+        fd.seek(0, os.SEEK_END)
+        end = fd.tell()
+        if end < FOOTER.size + 8:
+            raise ValueError('No seek table, not a seekable LZ4 file')
+        fd.seek(end - FOOTER.size)
+        count, descriptor, magic = FOOTER.unpack(LZ4Frame.read_exact(fd, FOOTER.size))
+        if magic != SEEKABLE_MAGIC:
+            raise ValueError('No seek table, not a seekable LZ4 file')
+        table_size = count * ENTRY.size + FOOTER.size
+        if end < table_size + 8:
+            raise ValueError('Truncated seek table')
+        fd.seek(end - table_size - 8)
+        table = LZ4Frame.read_exact(fd, table_size + 8)
+        if struct.unpack_from('<II', table) != (SEEK_TABLE_MAGIC, table_size):
+            raise ValueError('Invalid seek table frame')
+        # the blocks start right after the frame header
+        fd.seek(0)
+        self.frame = LZ4FrameReader(fd)
+        if not self.frame.read_header():
+            raise ValueError('Truncated LZ4 frame')
+        # block i is at positions[i] in the file and decodes to
+        # offsets[i]:offsets[i + 1]
+        self.positions = array('Q', [fd.tell()])
+        self.offsets = array('Q', [0])
+        for compressed, decompressed in ENTRY.iter_unpack(table[8:8 + count * ENTRY.size]):
+            self.positions.append(self.positions[-1] + compressed)
+            self.offsets.append(self.offsets[-1] + decompressed)
+        self.size = self.offsets[-1]
+        self.pos = 0
+        self.cached = -1
+        self.block = b''
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+        elif whence != os.SEEK_SET:
+            raise ValueError('Invalid whence %r' % whence)
+        if offset < 0:
+            raise ValueError('Negative seek position %d' % offset)
+        self.pos = offset
+        return offset
+
+    def read_block(self, index):
+        if index == self.cached:
+            return self.block
+        self.fd.seek(self.positions[index])
+        size = struct.unpack('<I', LZ4Frame.read_exact(self.fd, 4))[0]
+        uncompressed = bool(size & LZ4Frame.UNCOMPRESSED_FLAG)
+        size &= ~LZ4Frame.UNCOMPRESSED_FLAG
+        if 4 + size + (4 if self.frame.block_checksum else 0) != self.positions[index + 1] - self.positions[index]:
+            raise ValueError('Seek table does not match block %d' % index)
+        code = LZ4Frame.read_exact(self.fd, size)
+        if self.frame.block_checksum:
+            checksum = struct.unpack('<I', LZ4Frame.read_exact(self.fd, 4))[0]
+            if checksum != xxh32(code):
+                raise ValueError('Invalid LZ4 block checksum')
+        length = self.offsets[index + 1] - self.offsets[index]
+        if uncompressed:
+            if len(code) != length:
+                raise ValueError('Seek table does not match block %d' % index)
+            block = code
+        else:
+            block = lz_api.decompress(code, size=length)
+        self.cached = index
+        self.block = block
+        return block
+
+    def pread(self, offset, length):
+        # length bytes from offset (fewer at the end), the position is unchanged
+        if offset < 0:
+            raise ValueError('Negative read position %d' % offset)
+        end = min(offset + length, self.size)
+        chunks = []
+        index = bisect.bisect_right(self.offsets, offset) - 1
+        while offset < end:
+            block = self.read_block(index)
+            start = offset - self.offsets[index]
+            chunk = block[start:start + end - offset]
+            chunks.append(bytes(chunk))
+            offset += len(chunk)
+            index += 1
+        return b''.join(chunks)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = max(0, self.size - self.pos)
+        data = self.pread(self.pos, size)
+        self.pos += len(data)
+        return data
+
+    read1 = read
+
+    def readinto(self, buffer):
+        with memoryview(buffer) as view, view.cast('B') as target:
+            data = self.read(len(target))
+            target[:len(data)] = data
+            return len(data)
+
+
+def compress_file(source, dest, **kwargs):
+    writer = LZ4SeekableWriter(dest, **kwargs)
+    while True:
+        chunk = source.read(writer.block_size)
+        if not chunk:
+            break
+        writer.write(chunk)
+    writer.close()
+
+
+def main():
+    # usage: lz_seekable.py -c file [-1 .. -12] [-B4|-B5|-B6|-B7]
+    #        lz_seekable.py -r file offset length, prints the bytes read
+    if len(sys.argv) < 3:
+        print('Not enough arguments provided')
+    elif sys.argv[1] == '-c':
+        file = sys.argv[2]
+        options = {}
+        for arg in sys.argv[3:]:
+            if arg.startswith('-B') and arg[2:].isdigit() and int(arg[2:]) in LZ4Frame.BLOCK_SIZES:
+                options['block_size'] = LZ4Frame.BLOCK_SIZES[int(arg[2:])]
+            elif arg.startswith('-') and arg[1:].isdigit():
+                options['level'] = int(arg[1:])
+            else:
+                print('Unknown option', arg)
+                return
+        print('Compressing file', file)
+        options['content_size'] = os.path.getsize(file)
+        with open(file, 'rb') as fd, open(file + LZ4Frame.ENCODE_EXT, 'wb') as out:
+            compress_file(fd, out, **options)
+        print('Ratio:', options['content_size'] / os.path.getsize(file + LZ4Frame.ENCODE_EXT))
+    elif sys.argv[1] == '-r' and len(sys.argv) == 5:
+        with open(sys.argv[2], 'rb') as fd:
+            sys.stdout.buffer.write(LZ4SeekableReader(fd).pread(int(sys.argv[3]), int(sys.argv[4])))
+    else:
+        print('Unknown command', sys.argv[1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import sys
+
+import lz_api
+import lz_decoder
+from lz_common import DICTIONARY_SIZE, map_file
+
+
+# Streaming contexts, like LZ4_compress_fast_continue and
+# LZ4_decompress_safe_continue: every chunk becomes a block of its own that
+# may refer back up to 64 KB into the chunks before it (or the dictionary).
+# Blocks have to be decoded in order by a decompressor context seeing the
+# same chunks.
+#
+# The compressor appends every chunk to one window buffer, which the encoder
+# compresses from the chunk on, and the encoder keeps its match table, so a
+# chunk only indexes itself. Once the window grows past HISTORY_LIMIT it is
+# cut to the last 64 KB in place and indexed again.
+
+WINDOW_SIZE = 64 * 1024
+HISTORY_LIMIT = 4 * WINDOW_SIZE
+
+
+class LZ4StreamCompressor:
+
+    def __init__(self, level=lz_api.DEFAULT_LEVEL, dict=None, history_limit=HISTORY_LIMIT):
+        if history_limit < WINDOW_SIZE:
+            raise ValueError('Invalid history limit %d, expected %d or more' % (history_limit, WINDOW_SIZE))
+        self.encoder = lz_api.compressor(level)
+        self.history_limit = history_limit
+        self.reset(dict)
+
+    def reset(self, dict=None):
+        # starts a new stream, blocks no longer refer to the chunks before
+        self.window = bytearray(dict[-DICTIONARY_SIZE:]) if dict else bytearray()
+        self.resume = False
+
+    def compress_continue(self, chunk):
+        text = self.window
+        start = len(text)
+        text += chunk
+        if lz_api.incompressible(text, start):
+            # the chunk is indexed along with the next one
+            code = lz_api.literal_block(text, start)
+        else:
+            code = self.encoder.compress(text, start=start, resume=self.resume)
+            self.resume = True
+            if len(code) > len(chunk):
+                stored = lz_api.literal_block(text, start)
+                if len(stored) < len(code):
+                    code = stored
+        if len(text) > self.history_limit:
+            del text[:-WINDOW_SIZE]
+            self.resume = False
+        return code
+
+
+class LZ4StreamDecompressor:
+
+    def __init__(self, dict=None):
+        self.reset(dict)
+
+    def reset(self, dict=None):
+        self.history = bytes(dict[-DICTIONARY_SIZE:]) if dict else b''
+
+    def decompress_continue(self, code, size=None):
+        block = lz_decoder.decompress(code, size=size, prefix=self.history)
+        self.history = (self.history + block)[-WINDOW_SIZE:]
+        return block
+
+
+def main():
+    # usage: lz_stream.py file [-1 .. -12] [chunk size], compresses the file
+    # chunk by chunk and compares with compressing every chunk on its own
+    if len(sys.argv) < 2:
+        print('Not enough arguments provided')
+        return
+    level = lz_api.DEFAULT_LEVEL
+    chunk_size = 4096
+    for arg in sys.argv[2:]:
+        if arg.startswith('-') and arg[1:].isdigit():
+            level = int(arg[1:])
+        elif arg.isdigit() and int(arg) > 0:
+            chunk_size = int(arg)
+        else:
+            print('Unknown option', arg)
+            return
+    with open(sys.argv[1], 'rb') as fd:
+        text = map_file(fd)
+        chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+    compressor = LZ4StreamCompressor(level)
+    decompressor = LZ4StreamDecompressor()
+    linked = 0
+    for chunk in chunks:
+        code = compressor.compress_continue(chunk)
+        if decompressor.decompress_continue(code) != chunk:
+            raise RuntimeError('Stream does not roundtrip')
+        linked += len(code)
+    independent = sum(len(lz_api.compress(chunk, level)) for chunk in chunks)
+    print('Chunks:', len(chunks), 'of', chunk_size, 'bytes')
+    print('Ratio linked:', len(text) / linked if linked else 0)
+    print('Ratio independent:', len(text) / independent if independent else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+import sys
+import time
+
+from lz_common import map_file, match_length
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Suffix array match finder for the optimal parser (lz_R_dp.py). The input is
+# cut in blocks, each block is sorted together with the 64 KB window before
+# it, and the longest previous match of every position comes out of the
+# suffix and LCP arrays in amortized constant time: it is one of the two
+# lexicographic neighbours with a smaller position (PSV/NSV). When that one
+# is more than MAX_OFFSET back (the block end is further from the history
+# start) the ranks next to it are walked for the nearest one in reach.
+#
+# With NumPy every pass works on whole arrays: the prefix doubling classes
+# give the LCP array by binary lifting, and sparse tables of minima give the
+# PSV/NSV and the common prefix with them. Without it the same is done in
+# plain Python (Kasai LCP, stack based PSV/NSV).
+
+MAX_OFFSET = 65535
+MIN_LENGTH = 4
+WINDOW_SIZE = MAX_OFFSET + 1
+BLOCK_SIZE = 1 << 17 # positions resolved per suffix array, twice the history
+LOOKAHEAD = 1024 # bytes past the block sorted too, matches may run into them
+SCAN_LIMIT = 256 # ranks walked for a candidate within MAX_OFFSET
+
+
+def suffix_array(data):
+    # prefix doubling: suffixes are sorted by their first k bytes, then by 2k
+    n = len(data)
+    if n == 0:
+        return []
+    if numpy is not None:
+        return suffix_array_numpy(data)
+    rank = list(data)
+    sa = sorted(range(n), key=rank.__getitem__)
+    k = 1
+    while True:
+        keys = [(rank[i], rank[i + k] if i + k < n else -1) for i in range(n)]
+        sa.sort(key=keys.__getitem__)
+        new_rank = [0] * n
+        current = 0
+        for previous, index in zip(sa, sa[1:]):
+            if keys[index] != keys[previous]:
+                current += 1
+            new_rank[index] = current
+        rank = new_rank
+        if current == n - 1:
+            return sa
+        k *= 2
+
+
+def suffix_array_numpy(data):
+    return suffix_classes_numpy(data)[0].tolist()
+
+
+def suffix_classes_numpy(data):
+    # prefix doubling on arrays, returns the suffix array and classes, where
+    # classes[j] numbers the first 2 ** j bytes of every suffix: two suffixes
+    # start with the same 2 ** j bytes if they have the same number
+    n = len(data)
+    rank = numpy.frombuffer(data, dtype=numpy.uint8).astype(numpy.int64)
+    classes = [rank.astype(numpy.int32)]
+    k = 1
+    while True:
+        second = numpy.full(n, -1, dtype=numpy.int64)
+        if k < n:
+            second[:n - k] = rank[k:]
+        sa = numpy.lexsort((second, rank))
+        first_sorted = rank[sa]
+        second_sorted = second[sa]
+        changed = (first_sorted[1:] != first_sorted[:-1]) | (second_sorted[1:] != second_sorted[:-1])
+        sorted_rank = numpy.zeros(n, dtype=numpy.int64)
+        numpy.cumsum(changed, out=sorted_rank[1:])
+        rank = numpy.empty(n, dtype=numpy.int64)
+        rank[sa] = sorted_rank
+        classes.append(rank.astype(numpy.int32))
+        if sorted_rank[-1] == n - 1:
+            return sa, classes
+        k *= 2
+
+
+def lcp_array_numpy(sa, classes):
+    # lcp[r] as in lcp_array, for all ranks at once: the common prefix grows
+    # by 2 ** j while the next 2 ** j bytes of both suffixes have the same
+    # class, from the longest down. All classes of the last one differ, so
+    # no common prefix reaches its length
+    n = len(sa)
+    lcp = numpy.zeros(n, dtype=numpy.int64)
+    if n < 2:
+        return lcp
+    first = sa[:-1]
+    second = sa[1:]
+    length = numpy.zeros(n - 1, dtype=numpy.int64)
+    for j in range(len(classes) - 1, -1, -1):
+        a = first + length
+        b = second + length
+        same = (a < n) & (b < n)
+        same &= classes[j][numpy.minimum(a, n - 1)] == classes[j][numpy.minimum(b, n - 1)]
+        length += same.astype(numpy.int64) << j
+    lcp[1:] = length
+    return lcp
+
+
+def min_table(values):
+    # sparse table: table[j, i] = min(values[i - 2 ** j + 1:i + 1]), rows
+    # up to the longest power of two that fits
+    n = len(values)
+    levels = max(1, n.bit_length())
+    table = numpy.empty((levels, n), dtype=values.dtype)
+    table[0] = values
+    for j in range(1, levels):
+        width = 1 << (j - 1)
+        table[j] = table[j - 1]
+        numpy.minimum(table[j - 1][width:], table[j - 1][:-width], out=table[j][width:])
+    return table
+
+
+def range_min(table, low, high):
+    # min(values[low:high + 1]) for arrays of bounds, low <= high
+    j = numpy.zeros(len(low), dtype=numpy.int64)
+    size = high - low + 1
+    for level in range(1, len(table)):
+        j += size >= (1 << level)
+    return numpy.minimum(table[j, high], table[j, low + (1 << j) - 1])
+
+
+def previous_smaller_numpy(values):
+    # index of the nearest smaller value before every one, -1 if none. The
+    # bigger values right before an index are skipped by spans of 2 ** j,
+    # from the longest down, whose minimum is still bigger
+    n = len(values)
+    table = min_table(values)
+    current = numpy.arange(-1, n - 1)
+    for j in range(len(table) - 1, -1, -1):
+        width = 1 << j
+        skip = (current - width + 1 >= 0) & (table[j][numpy.maximum(current, 0)] > values)
+        current = numpy.where(skip, current - width, current)
+    return current
+
+
+def walk_numpy(sa, lcp, local, ranks, lengths, min_length, step):
+    # nearest_in_reach for arrays of positions, going on from their out of
+    # reach candidates at ranks with their common prefix lengths
+    n = len(sa)
+    found_lengths = numpy.zeros(len(local), dtype=numpy.int64)
+    found = numpy.full(len(local), -1, dtype=numpy.int64)
+    active = numpy.arange(len(local))
+    for _ in range(SCAN_LIMIT):
+        if not len(active):
+            break
+        if step < 0:
+            alive = ranks > 0
+            link = lcp[numpy.maximum(ranks, 0)]
+            ranks = ranks - 1
+        else:
+            alive = ranks + 1 < n
+            link = lcp[numpy.minimum(ranks + 1, n - 1)]
+            ranks = ranks + 1
+        lengths = numpy.minimum(lengths, link)
+        alive &= lengths >= min_length
+        candidates = sa[numpy.clip(ranks, 0, n - 1)]
+        hit = alive & (candidates < local) & (local - candidates <= MAX_OFFSET)
+        found_lengths[active[hit]] = lengths[hit]
+        found[active[hit]] = candidates[hit]
+        keep = alive & ~hit
+        active = active[keep]
+        local = local[keep]
+        ranks = ranks[keep]
+        lengths = lengths[keep]
+    return found_lengths, found
+
+
+def block_matches_numpy(data, begin, end, min_length):
+    # block_matches on arrays
+    n = len(data)
+    sa, classes = suffix_classes_numpy(data)
+    lcp = lcp_array_numpy(sa, classes)
+    del classes
+    rank = numpy.empty(n, dtype=numpy.int64)
+    rank[sa] = numpy.arange(n)
+    lcp_table = min_table(lcp)
+    local = numpy.arange(begin, end)
+    r = rank[begin:end]
+    # nearest rank below with a smaller position, and the prefix shared
+    # with it: the minimum of the LCP between them
+    below = previous_smaller_numpy(sa)[r]
+    has = below >= 0
+    length = numpy.where(has, range_min(lcp_table, numpy.where(has, below + 1, r), r), 0)
+    candidate = numpy.where(has, sa[numpy.maximum(below, 0)], -1)
+    # and above, on the reversed suffix array
+    above = n - 1 - previous_smaller_numpy(sa[::-1].copy())[::-1][r]
+    has = above < n
+    after_length = numpy.where(has, range_min(lcp_table, numpy.where(has, r + 1, r), numpy.where(has, above, r)), 0)
+    after_candidate = numpy.where(has, sa[numpy.minimum(above, n - 1)], -1)
+    for ranks, lengths, candidates, step in ((below, length, candidate, -1),
+                                             (above, after_length, after_candidate, 1)):
+        far = (local - candidates > MAX_OFFSET) & (lengths >= min_length)
+        if far.any():
+            lengths[far], candidates[far] = walk_numpy(sa, lcp, local[far], ranks[far], lengths[far],
+                                                       min_length, step)
+    better = (after_length > length) | ((after_length == length) & (after_candidate > candidate))
+    length = numpy.where(better, after_length, length)
+    candidate = numpy.where(better, after_candidate, candidate)
+    return length.tolist(), candidate.tolist()
+
+
+def inverse(sa):
+    # rank of every suffix
+    rank = [0] * len(sa)
+    for r, position in enumerate(sa):
+        rank[position] = r
+    return rank
+
+
+def lcp_array(data, sa):
+    # Kasai: lcp[r] is the common prefix of the suffixes ranked r - 1 and r
+    n = len(data)
+    rank = inverse(sa)
+    lcp = [0] * n
+    h = 0
+    for position in range(n):
+        r = rank[position]
+        if r == 0:
+            h = 0
+            continue
+        other = sa[r - 1]
+        while position + h < n and other + h < n and data[position + h] == data[other + h]:
+            h += 1
+        lcp[r] = h
+        if h:
+            h -= 1
+    return lcp
+
+
+def previous_smaller(sa, lcp, reverse=False):
+    # for every suffix, the nearest one in rank order (below it, or above it
+    # when reverse) that starts earlier in the data and their common prefix.
+    # The stack holds increasing positions, links[k] is the common prefix of
+    # stack[k] and stack[k + 1].
+    n = len(sa)
+    candidates = [-1] * n
+    lengths = [0] * n
+    stack = []
+    links = []
+    for r in (range(n - 1, -1, -1) if reverse else range(n)):
+        position = sa[r]
+        # common prefix with the suffix visited before
+        if reverse:
+            h = lcp[r + 1] if r + 1 < n else 0
+        else:
+            h = lcp[r]
+        while stack and stack[-1] > position:
+            stack.pop()
+            if links:
+                link = links.pop()
+                if link < h:
+                    h = link
+        if stack:
+            candidates[position] = stack[-1]
+            lengths[position] = h
+            links.append(h)
+        stack.append(position)
+    return candidates, lengths
+
+
+def nearest_in_reach(sa, lcp, rank, local, min_length, step):
+    # walks the ranks away from the suffix at local (down with step -1, up
+    # with +1) for the first one starting at most MAX_OFFSET before it. The
+    # common prefix only shrinks on the way, so it is the longest match in
+    # that direction. Returns (length, candidate), candidate -1 if none
+    r = rank[local]
+    n = len(sa)
+    length = None
+    for _ in range(SCAN_LIMIT):
+        if step < 0:
+            if r == 0:
+                break
+            link = lcp[r]
+            r -= 1
+        else:
+            r += 1
+            if r == n:
+                break
+            link = lcp[r]
+        length = link if length is None else min(length, link)
+        if length < min_length:
+            break
+        candidate = sa[r]
+        if candidate < local and local - candidate <= MAX_OFFSET:
+            return length, candidate
+    return 0, -1
+
+
+def block_matches(data, begin, end, min_length):
+    # longest match within MAX_OFFSET of every position begin <= local < end
+    # of data, as a list of lengths and a list of positions (-1 if none)
+    if numpy is not None:
+        return block_matches_numpy(data, begin, end, min_length)
+    sa = suffix_array(data)
+    lcp = lcp_array(data, sa)
+    before, before_lengths = previous_smaller(sa, lcp)
+    after, after_lengths = previous_smaller(sa, lcp, reverse=True)
+    rank = None
+    lengths = []
+    candidates = []
+    for local in range(begin, end):
+        length = before_lengths[local]
+        candidate = before[local]
+        after_length = after_lengths[local]
+        after_candidate = after[local]
+        if local - candidate > MAX_OFFSET and length >= min_length:
+            if rank is None:
+                rank = inverse(sa)
+            length, candidate = nearest_in_reach(sa, lcp, rank, local, min_length, -1)
+        if local - after_candidate > MAX_OFFSET and after_length >= min_length:
+            if rank is None:
+                rank = inverse(sa)
+            after_length, after_candidate = nearest_in_reach(sa, lcp, rank, local, min_length, 1)
+        if after_length > length or (after_length == length and after_candidate > candidate):
+            length = after_length
+            candidate = after_candidate
+        lengths.append(length)
+        candidates.append(candidate)
+    return lengths, candidates
+
+
+def longest_matches(text, start, end, limit, lengths, distances, block_size=BLOCK_SIZE,
+                    min_length=MIN_LENGTH, origin=0):
+    # fills lengths[i - origin] and distances[i - origin] with the longest
+    # match of every position start <= i < end, matches end before limit.
+    # Positions without a match of min_length are left as they are.
+    for block_start in range(start, end, block_size):
+        block_end = min(block_start + block_size, end)
+        base = max(0, block_start - MAX_OFFSET)
+        data = bytes(text[base:max(block_end, min(block_end + LOOKAHEAD, limit))])
+        size = len(data)
+        block_lengths, candidates = block_matches(data, block_start - base, block_end - base, min_length)
+        for i, length, candidate in zip(range(block_start, block_end), block_lengths, candidates):
+            if length < min_length:
+                continue
+            local = i - base
+            distance = local - candidate
+            if local + length == size:
+                # the suffixes were cut at the block end, keep going in text.
+                # Inside a long repeat the previous position already knows
+                # how far it goes
+                previous = lengths[i - origin - 1] - 1 if i > start else 0
+                if previous > length:
+                    length = previous
+                    distance = distances[i - origin - 1]
+                else:
+                    length += match_length(text, i + length - distance, i + length, limit)
+            length = min(length, limit - i)
+            if length >= min_length:
+                lengths[i - origin] = length
+                distances[i - origin] = distance
+
+
+def main():
+    # usage: lz_suffix.py file, prints how much of the file the matches cover
+    if len(sys.argv) < 2:
+        print('Not enough arguments provided')
+        return
+    file = sys.argv[1]
+    with open(file, 'rb') as fd:
+        text = map_file(fd)
+        lengths = [1] * len(text)
+        distances = [1] * len(text)
+        begin = time.perf_counter()
+        longest_matches(text, 0, max(0, len(text) - 12), len(text) - 5, lengths, distances)
+        elapsed = time.perf_counter() - begin
+        print('Match finder:', 'numpy' if numpy is not None else 'python')
+        print('Positions with a match:', sum(1 for length in lengths if length > 1), 'of', len(text))
+        print('Time:', elapsed)
+
+
+if __name__ == "__main__":
+    main()
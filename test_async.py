@@ -0,0 +1,114 @@
+import asyncio
+import gc
+import random
+import unittest
+from unittest import mock
+
+import lz_api
+import lz_async
+from corpus import english_text, take
+from lz_frame import LZ4FrameDecompressor
+
+
+# Concurrent compression on the loop's default thread pool: encoders of the
+# same level run at the same time and must not share state.
+
+CONCURRENT_CALLS = 64
+
+
+def sample(seed, size):
+    return b''.join(take(english_text(random.Random(seed)), size))
+
+
+class BufferWriter:
+    # the part of asyncio.StreamWriter the frame writer uses
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+
+    async def drain(self):
+        await asyncio.sleep(0)
+
+
+def decode_frame(frame):
+    decompressor = LZ4FrameDecompressor()
+    data = decompressor.feed(bytes(frame))
+    decompressor.close()
+    return data
+
+
+class ConcurrentCompressionTest(unittest.TestCase):
+
+    def test_compress_async(self):
+        messages = [sample(seed, 2000 + 97 * seed) for seed in range(CONCURRENT_CALLS)]
+
+        async def run(level, dict=None):
+            return await asyncio.gather(*(lz_async.compress_async(message, level, dict=dict)
+                                          for message in messages))
+
+        dictionary = sample(CONCURRENT_CALLS, 20000)
+        for level, dict in ((1, None), (lz_api.DEFAULT_LEVEL, None), (lz_api.DEFAULT_LEVEL, dictionary),
+                            (11, dictionary)):
+            codes = asyncio.run(run(level, dict))
+            for message, code in zip(messages, codes):
+                self.assertEqual(bytes(lz_api.decompress(code, len(message), dict=dict)), message)
+                self.assertEqual(bytes(code), bytes(lz_api.compress(message, level, dict=dict)))
+
+    def test_frame_writer(self):
+        data = sample(0, 600000)
+
+        async def run():
+            stream = BufferWriter()
+            writer = lz_async.LZ4AsyncFrameWriter(stream)
+            await writer.write(data)
+            await writer.close()
+            return stream.buffer
+
+        self.assertEqual(decode_frame(asyncio.run(run())), data)
+
+    def test_frame_writer_checksums(self):
+        data = sample(2, 300000)
+
+        async def run(**kwargs):
+            stream = BufferWriter()
+            writer = lz_async.LZ4AsyncFrameWriter(stream, block_checksum=True, **kwargs)
+            await writer.write(data[:100000])
+            await writer.write(data[100000:])
+            await writer.close()
+            return stream.buffer
+
+        for block_linked in (False, True):
+            self.assertEqual(decode_frame(asyncio.run(run(block_linked=block_linked))), data)
+
+    def test_frame_writer_failure(self):
+        # a failed block cancels or waits for the others, no future is left
+        # with an exception nobody retrieved
+        data = sample(1, 400000)
+        errors = []
+        calls = []
+
+        def compress_block(block, level):
+            calls.append(block)
+            if len(calls) == 2:
+                raise RuntimeError('block failed')
+            return lz_api.compress(block, level)
+
+        async def run():
+            asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+            writer = lz_async.LZ4AsyncFrameWriter(BufferWriter(), workers=4)
+            with self.assertRaises(RuntimeError):
+                await writer.write(data)
+                await writer.close()
+            self.assertFalse(writer.pending)
+
+        with mock.patch('lz_frame.compress_block', compress_block):
+            asyncio.run(run())
+        gc.collect()
+        self.assertEqual(errors, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
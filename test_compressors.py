@@ -0,0 +1,44 @@
+import random
+import unittest
+
+import lz
+import lz_R
+import lz_R_dp
+import lz_R_v2
+import lz_T
+import lz_T_for
+import lz_T_v2
+import lz_decoder
+import lz_v2
+from corpus import english_text, take
+from lz_common import SUFFIX_ARRAY
+
+
+# Every compressor variant takes any buffer, a bytearray compresses to the
+# same block as the bytes it holds.
+
+VARIANTS = (lz, lz_v2, lz_T, lz_T_v2, lz_T_for, lz_R, lz_R_v2, lz_R_dp)
+
+
+def sample(seed, size):
+    return b''.join(take(english_text(random.Random(seed)), size))
+
+
+class BufferInputTest(unittest.TestCase):
+
+    def test_bytearray(self):
+        data = sample(0, 20000)
+        for module in VARIANTS:
+            with self.subTest(module=module.__name__):
+                code = module.LZ4().compress(bytearray(data))
+                self.assertEqual(bytes(code), bytes(module.LZ4().compress(data)))
+                self.assertEqual(bytes(lz_decoder.decompress(bytes(code), len(data))), data)
+
+    def test_bytearray_suffix_array(self):
+        data = sample(1, 20000)
+        code = lz_R_dp.LZ4(match_finder=SUFFIX_ARRAY).compress(bytearray(data))
+        self.assertEqual(bytes(lz_decoder.decompress(bytes(code), len(data))), data)
+
+
+if __name__ == '__main__':
+    unittest.main()
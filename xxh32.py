@@ -0,0 +1,83 @@
+import struct
+
+
+# xxHash32 as used by the LZ4 frame format for header, block and content
+# checksums. Pure python, it processes the input in 16 byte stripes.
+
+PRIME32_1 = 2654435761
+PRIME32_2 = 2246822519
+PRIME32_3 = 3266489917
+PRIME32_4 = 668265263
+PRIME32_5 = 374761393
+
+MASK = 0xFFFFFFFF
+STRIPE = 16
+
+
+def rotl(value, count):
+    return ((value << count) | (value >> (32 - count))) & MASK
+
+
+class XXH32:
+
+    def __init__(self, seed=0):
+        self.seed = seed
+        self.v1 = (seed + PRIME32_1 + PRIME32_2) & MASK
+        self.v2 = (seed + PRIME32_2) & MASK
+        self.v3 = seed
+        self.v4 = (seed - PRIME32_1) & MASK
+        self.total_length = 0
+        self.buffer = b''
+
+    def update(self, data):
+        self.total_length += len(data)
+        if self.buffer:
+            data = self.buffer + bytes(data)
+        # only full stripes are consumed, the tail waits for more data
+        stripes = len(data) // STRIPE
+        if stripes:
+            v1, v2, v3, v4 = self.v1, self.v2, self.v3, self.v4
+            lanes = struct.unpack_from('<%dI' % (stripes * 4), data)
+            for i in range(0, stripes * 4, 4):
+                v1 = (v1 + lanes[i] * PRIME32_2) & MASK
+                v1 = (((v1 << 13) | (v1 >> 19)) & MASK) * PRIME32_1 & MASK
+                v2 = (v2 + lanes[i + 1] * PRIME32_2) & MASK
+                v2 = (((v2 << 13) | (v2 >> 19)) & MASK) * PRIME32_1 & MASK
+                v3 = (v3 + lanes[i + 2] * PRIME32_2) & MASK
+                v3 = (((v3 << 13) | (v3 >> 19)) & MASK) * PRIME32_1 & MASK
+                v4 = (v4 + lanes[i + 3] * PRIME32_2) & MASK
+                v4 = (((v4 << 13) | (v4 >> 19)) & MASK) * PRIME32_1 & MASK
+            self.v1, self.v2, self.v3, self.v4 = v1, v2, v3, v4
+        self.buffer = bytes(data[stripes * STRIPE:])
+
+    def intdigest(self):
+        if self.total_length >= STRIPE:
+            h = (rotl(self.v1, 1) + rotl(self.v2, 7) + rotl(self.v3, 12) + rotl(self.v4, 18)) & MASK
+        else:
+            h = (self.seed + PRIME32_5) & MASK
+        h = (h + self.total_length) & MASK
+        tail = self.buffer
+        i = 0
+        # remaining 4 byte words
+        while i + 4 <= len(tail):
+            h = (h + struct.unpack_from('<I', tail, i)[0] * PRIME32_3) & MASK
+            h = rotl(h, 17) * PRIME32_4 & MASK
+            i += 4
+        # remaining bytes
+        while i < len(tail):
+            h = (h + tail[i] * PRIME32_5) & MASK
+            h = rotl(h, 11) * PRIME32_1 & MASK
+            i += 1
+        # final avalanche
+        h ^= h >> 15
+        h = h * PRIME32_2 & MASK
+        h ^= h >> 13
+        h = h * PRIME32_3 & MASK
+        h ^= h >> 16
+        return h
+
+
+def xxh32(data, seed=0):
+    hasher = XXH32(seed)
+    hasher.update(data)
+    return hasher.intdigest()